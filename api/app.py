@@ -1,17 +1,20 @@
 import asyncio
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from db.session import engine
-from db.models import Base, User, ApiKey, AccountSetting
+from db.migrate import upgrade_head
+from db.models import User, ApiKey, AccountSetting
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.session import AsyncSessionLocal
 from config import settings
+from user_cache import user_cache
 from core.orchestrator import UserOrchestrator
+from core.hub import get_hub
 import sqlalchemy
 import contextlib
 
 app = FastAPI()
 _loops = {}
+_orchestrators = {}
 
 class RegisterPayload(BaseModel):
     username: str
@@ -30,10 +33,50 @@ class StartPayload(BaseModel):
 class StopPayload(BaseModel):
     user_id: int
 
+async def _api_keys(session, user_id):
+    # hot-path reads of user config go through the in-process cache;
+    # every write below invalidates the entries it touches after committing
+    async def load():
+        q = await session.execute(sqlalchemy.select(ApiKey).where(ApiKey.user_id==user_id))
+        key = q.scalars().first()
+        return {'api_key': key.api_key, 'api_secret': key.api_secret} if key else None
+    return await user_cache.get_or_load(('ApiKey', user_id), load)
+
+async def _account_settings(session, user_id):
+    async def load():
+        q = await session.execute(sqlalchemy.select(AccountSetting).where(AccountSetting.user_id==user_id))
+        acc = q.scalars().first()
+        if not acc:
+            return None
+        # trading_amount_usdt is left out: /start overwrites it on every run
+        return {
+            'bnb_reserve': acc.bnb_reserve,
+            'inventory_mode': acc.inventory_mode,
+            'inventory_targets': acc.inventory_targets,
+        }
+    return await user_cache.get_or_load(('AccountSetting', user_id), load)
+
 @app.on_event('startup')
 async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await upgrade_head()
+    if settings.opportunity_partitions:
+        from core.retention import run_retention_loop
+        app.state.retention_task = asyncio.create_task(run_retention_loop())
+
+@app.on_event('shutdown')
+async def shutdown():
+    # stop the user loops first so nothing is submitted after the writer's final flush
+    tasks = list(_loops.values())
+    retention = getattr(app.state, 'retention_task', None)
+    if retention is not None:
+        tasks.append(retention)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _loops.clear()
+    _orchestrators.clear()
+    from core.persistence import get_writer
+    await get_writer().stop()
 
 @app.get('/whoami')
 async def whoami(chat_id: int):
@@ -47,14 +90,27 @@ async def whoami(chat_id: int):
 @app.get('/market_summary')
 async def market_summary():
     try:
-        from exchange.binance_client import BinanceClient
-        b = BinanceClient()
-        mkts = b.load_markets()
+        from exchange.markets_cache import cached_markets
+        mkts = await asyncio.to_thread(cached_markets)
         symbols = list(mkts.keys())[:40]
         return "ملخص السوق: عدد أزواج محمّلة: %d" % len(symbols)
     except Exception as e:
         raise HTTPException(500, str(e))
 
+@app.get('/metrics')
+async def metrics():
+    from core.persistence import get_writer
+    return {
+        'opportunity_writer': get_writer().stats(),
+        'scan_latency_ms': {uid: o.scan_stats for uid, o in _orchestrators.items()},
+        'user_cache': user_cache.stats(),
+    }
+
+@app.get('/opportunities/summary')
+async def opportunities_summary(minutes: int = 60, limit: int = 20):
+    from core.persistence import recent_rollups
+    return await recent_rollups(minutes=minutes, limit=limit, ttl=0)
+
 @app.post('/register')
 async def register(p: RegisterPayload):
     async with AsyncSessionLocal() as session:
@@ -76,6 +132,7 @@ async def add_keys(p: ApiKeysPayload):
         ak = ApiKey(user_id=p.user_id, api_key=p.api_key, api_secret=p.api_secret, can_withdraw=p.can_withdraw)
         session.add(ak)
         await session.commit()
+        user_cache.invalidate(('ApiKey', p.user_id))
         return {"ok": True}
 
 @app.post('/settings')
@@ -95,6 +152,10 @@ async def post_settings(p: dict):
             acc.trading_amount_usdt = float(p.get('trading_amount_usdt'))
         if p.get('bnb_reserve') is not None:
             acc.bnb_reserve = float(p.get('bnb_reserve'))
+        if p.get('inventory_mode') is not None:
+            acc.inventory_mode = bool(p.get('inventory_mode'))
+        if p.get('inventory_targets') is not None:
+            acc.inventory_targets = {k: float(v) for k, v in p.get('inventory_targets').items()}
         # store api keys
         if p.get('api_key') and p.get('api_secret'):
             q = await session.execute(sqlalchemy.select(ApiKey).where(ApiKey.user_id==user_id))
@@ -106,6 +167,7 @@ async def post_settings(p: dict):
                 ak = ApiKey(user_id=user_id, api_key=p.get('api_key'), api_secret=p.get('api_secret'), can_withdraw=False)
                 session.add(ak)
         await session.commit()
+        user_cache.invalidate(('ApiKey', user_id), ('AccountSetting', user_id))
         return {'ok': True}
 
 @app.post('/start')
@@ -116,24 +178,27 @@ async def start(p: StartPayload):
         u = await session.get(User, p.user_id)
         if not u:
             raise HTTPException(404, 'user not found')
-        q = await session.execute(sqlalchemy.select(ApiKey).where(ApiKey.user_id==p.user_id))
-        key = q.scalars().first()
+        key = await _api_keys(session, p.user_id)
         if not key:
             raise HTTPException(400, 'api keys not found')
         from exchange.binance_client import BinanceClient
-        b = BinanceClient(key.api_key, key.api_secret)
+        b = BinanceClient(key['api_key'], key['api_secret'])
         try:
             _ = b.fetch_balance()
         except Exception as e:
             raise HTTPException(400, f'api keys invalid: {e}')
-        accq = await session.execute(sqlalchemy.select(AccountSetting).where(AccountSetting.user_id==p.user_id))
-        acc = accq.scalars().first()
-        acc.trading_amount_usdt = p.trade_amount_usdt
-        acc.is_running = True
+        acc = await _account_settings(session, p.user_id)
+        await session.execute(
+            sqlalchemy.update(AccountSetting)
+            .where(AccountSetting.user_id==p.user_id)
+            .values(trading_amount_usdt=p.trade_amount_usdt, is_running=True)
+        )
         await session.commit()
-        orch = UserOrchestrator(p.user_id, key.api_key, key.api_secret, p.trade_amount_usdt)
+        targets = acc['inventory_targets'] if acc and acc['inventory_mode'] else None
+        orch = UserOrchestrator(p.user_id, key['api_key'], key['api_secret'], p.trade_amount_usdt, await get_hub(), inventory_targets=targets)
         task = asyncio.create_task(orch.run_loop())
         _loops[p.user_id] = task
+        _orchestrators[p.user_id] = orch
         return {'ok': True}
 
 @app.post('/stop')
@@ -145,12 +210,12 @@ async def stop(p: StopPayload):
     with contextlib.suppress(Exception):
         await t
     _loops.pop(p.user_id, None)
+    _orchestrators.pop(p.user_id, None)
     async with AsyncSessionLocal() as session:
-        accq = await session.execute(sqlalchemy.select(AccountSetting).where(AccountSetting.user_id==p.user_id))
-        acc = accq.scalars().first()
-        if acc:
-            acc.is_running = False
-            await session.commit()
+        await session.execute(
+            sqlalchemy.update(AccountSetting).where(AccountSetting.user_id==p.user_id).values(is_running=False)
+        )
+        await session.commit()
     return {'ok': True}
 
 @app.get('/report')
@@ -12,9 +12,10 @@ from telegram.ext import (
 )
 
 # Imports from other files
-from db import create_user, save_api_keys, get_user_api_keys, save_amount, get_amount, get_last_trades, create_tables
+from db import create_user, save_api_keys, get_user_api_keys, save_amount, get_amount, get_last_trades, create_tables, init_pool, close_pool
 from trading import start_arbitrage, stop_arbitrage, get_client_for_user
 from ai_strategy import AIStrategy
+from exchange.ticker_hub import ticker_hub
 
 # Logging setup
 logging.basicConfig(
@@ -101,7 +102,7 @@ async def market_status_command(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text("❌ لم تسجل مفاتيح Binance بعد. اذهب للإعدادات واكتب **Link API**.")
         return
 
-    tickers = await client.get_all_tickers()
+    tickers = await ticker_hub.get_all_tickers()
     sample = ", ".join([t["symbol"] for t in tickers[:40]])
     analysis = await asyncio.to_thread(lambda: ai.analyze({"sample_symbols": sample}))
     chunks = [analysis[i:i+800] for i in range(0, len(analysis), 800)]
@@ -183,14 +184,19 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await update.message.reply_text("📌 استخدم قائمة الأوامر أو اكتب /help.")
 
+async def post_init(application: Application):
+    # The pool belongs to the bot's event loop, so it is opened here rather than before run_polling
+    await init_pool()
+    await create_tables()
+
+async def post_shutdown(application: Application):
+    await close_pool()
+
 def main():
     if not BOT_TOKEN:
         raise ValueError("⚠️ لم يتم العثور على TELEGRAM_BOT_TOKEN في المتغيرات البيئية")
 
-    # This creates tables asynchronously before starting the bot
-    asyncio.run(create_tables())
-
-    app = Application.builder().token(BOT_TOKEN).build()
+    app = Application.builder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     # Add handlers for commands
     app.add_handler(CommandHandler("start", start_command))
@@ -6,15 +6,16 @@ if settings.openai_api_key:
 else:
     openai = None
 
-async def summarize_market(top_routes: list[dict]) -> str:
+async def summarize_rollups(rollups: list[dict]) -> str:
+    # rollups: rows from core.persistence.recent_rollups (route, samples, viable, avg/min/max_net_pct)
     if not settings.openai_api_key or not settings.openai_ranking_enabled:
         lines = []
-        for r in top_routes[:5]:
-            lines.append(f"المسار: {[x[0] for x in r.get('route', [])]} | صافي={r.get('net_pct',0):.4f}% | طول={r.get('length',0)}")
+        for r in rollups[:5]:
+            lines.append(f"المسار: {r['route']} | متوسط صافي={r['avg_net_pct']:.4f}% | أعلى={r['max_net_pct']:.4f}% | مرات={r['samples']} | مجدية={r['viable']}")
         return "\n".join(lines)
 
-    prompt = "لخص فرص المراجحة الحالية والمخاطر باختصار بالعربية:\n" + "\n".join([
-        f"{i+1}. {[x[0] for x in r.get('route', [])]} net={r.get('net_pct',0):.4f}% len={r.get('length',0)}" for i,r in enumerate(top_routes[:20])
+    prompt = "لخص فرص المراجحة خلال الدقائق الأخيرة والمخاطر باختصار بالعربية:\n" + "\n".join([
+        f"{i+1}. {r['route']} avg={r['avg_net_pct']:.4f}% max={r['max_net_pct']:.4f}% min={r['min_net_pct']:.4f}% seen={r['samples']} viable={r['viable']} len={r['length']}" for i,r in enumerate(rollups[:20])
     ])
 
     try:
@@ -1,10 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
 from exchange.binance_client import BinanceClient
 from config import settings
 
 class Executor:
-    def __init__(self, markets, api_key=None, api_secret=None):
+    def __init__(self, markets, api_key=None, api_secret=None, prices=None, inventory_targets=None):
         self.client = BinanceClient(api_key, api_secret)
+        self.prices = prices
+        # asset -> amount to keep on hand; None keeps the sequential mode
+        self.inventory_targets = inventory_targets or None
+        self.pool = None
+        # exchange.user_stream.BalanceCache when the user-data stream is enabled
+        self.balances = None
+        self.set_markets(markets)
+
+    def set_markets(self, markets):
+        # reuse the shared markets instead of a per-user load_markets() download
         self.markets = markets
+        self.client.set_markets(markets)
 
     def _amount_for_leg(self, symbol, side, price, notional_usdt):
         amt = notional_usdt / price
@@ -13,14 +25,21 @@ class Executor:
         return round(max(amt, min_step), step)
 
     def market_price(self, symbol, side):
+        if self.prices is not None:
+            return self.prices.best_price(symbol, side=='buy')
         book = self.client.fetch_order_book(symbol, 5)
         if not book:
             return None
         return book['asks'][0][0] if side=='buy' else book['bids'][0][0]
 
+    def free_balances(self):
+        cached = self.balances.free_balances() if self.balances is not None else None
+        if cached is not None:
+            return cached
+        return self.client.fetch_balance().get('free', {})
+
     def ensure_bnb_reserve(self, min_bnb, topup_usdt):
-        bal = self.client.fetch_balance()
-        bnb_free = bal.get('free', {}).get('BNB', 0.0)
+        bnb_free = self.free_balances().get('BNB', 0.0)
         if bnb_free >= min_bnb:
             return None
         price = self.market_price('BNB/USDT', 'buy')
@@ -29,18 +48,92 @@ class Executor:
         amt = round(topup_usdt / price, 6)
         return self.client.create_market_order('BNB/USDT', 'buy', amt)
 
-    def execute_route(self, route_legs, notional_usdt):
-        self.ensure_bnb_reserve(settings.bnb_min_reserve, settings.bnb_topup_usdt)
-        fills = []
+    def _plan(self, route_legs, notional_usdt):
+        # size every leg up front by carrying the notional through the quoted prices,
+        # so each amount is in the leg's own base asset
+        legs = []
+        held = notional_usdt
+        start = route_legs[0][2]
+        if start != 'USDT':
+            # routes anchored on another core quote spend the notional's worth of that asset
+            px = self.market_price(f"{start}/USDT", 'sell')
+            if not px:
+                return None, f"{start}/USDT"
+            held = notional_usdt / px
         for (symbol, side, frm, to) in route_legs:
             px = self.market_price(symbol, side)
             if not px:
-                return {"ok": False, "reason": "no_price", "where": symbol}
-            amt = self._amount_for_leg(symbol, side, px, notional_usdt)
+                return None, symbol
+            amt = self._amount_for_leg(symbol, side, px, held if side == 'buy' else held * px)
+            # what the leg spends: quote for a buy, base for a sell
+            spend = amt * px if side == 'buy' else amt
+            legs.append((symbol, side, frm, spend, amt, px))
+            held = amt if side == 'buy' else amt * px
+        return legs, None
+
+    def inventory_covers(self, legs, free):
+        need = {}
+        for (symbol, side, frm, spend, amt, px) in legs:
+            need[frm] = need.get(frm, 0.0) + spend
+        return all(free.get(asset, 0.0) >= qty for asset, qty in need.items())
+
+    def execute_route(self, route_legs, notional_usdt):
+        self.ensure_bnb_reserve(settings.bnb_min_reserve, settings.bnb_topup_usdt)
+        legs, missing = self._plan(route_legs, notional_usdt)
+        if legs is None:
+            return {"ok": False, "reason": "no_price", "where": missing}
+        if self.inventory_targets:
+            free = self.free_balances()
+            if self.inventory_covers(legs, free):
+                return self._execute_concurrent(legs)
+        fills = []
+        for (symbol, side, frm, spend, amt, px) in legs:
             order = self.client.create_market_order(symbol, side, amt)
             fills.append({"symbol": symbol, "side": side, "amt": amt, "price": px, "order": order})
         return {"ok": True, "fills": fills}
 
+    def _execute_concurrent(self, legs):
+        # every leg spends inventory that is already on hand, so none waits for the previous fill;
+        # ccxt is synchronous, hence one thread per leg
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=settings.max_route_len, thread_name_prefix="leg")
+        futures = [(leg, self.pool.submit(self.client.create_market_order, leg[0], leg[1], leg[4])) for leg in legs]
+        fills, errors = [], []
+        for (symbol, side, frm, spend, amt, px), fut in futures:
+            try:
+                fills.append({"symbol": symbol, "side": side, "amt": amt, "price": px, "order": fut.result()})
+            except Exception as e:
+                errors.append({"symbol": symbol, "side": side, "error": str(e)})
+        res = {"ok": not errors, "mode": "inventory", "fills": fills}
+        if errors:
+            res["errors"] = errors
+        return res
+
+    def rebalance(self, tolerance_pct=None):
+        # brings each inventory asset back to its target through its USDT market
+        if not self.inventory_targets:
+            return []
+        tolerance_pct = settings.inventory_rebalance_pct if tolerance_pct is None else tolerance_pct
+        free = self.free_balances()
+        orders = []
+        for asset, target in self.inventory_targets.items():
+            symbol = f"{asset}/USDT"
+            if asset == 'USDT' or symbol not in self.markets or not target:
+                continue
+            diff = float(target) - free.get(asset, 0.0)
+            if abs(diff) / float(target) * 100 < tolerance_pct:
+                continue
+            side = 'buy' if diff > 0 else 'sell'
+            px = self.market_price(symbol, side)
+            if not px:
+                continue
+            amt = self._amount_for_leg(symbol, side, px, abs(diff) * px)
+            try:
+                orders.append({"asset": asset, "side": side, "amt": amt, "order": self.client.create_market_order(symbol, side, amt)})
+            except Exception as e:
+                orders.append({"asset": asset, "side": side, "amt": amt, "error": str(e)})
+        return orders
+
     def settle_fee(self, user_id, profit_usdt, fee_pct, withdraw_addr=None):
         fee = profit_usdt * fee_pct / 100.0
         if fee <= 0:
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import time
+import numpy as np
+from exchange.binance_client import BinanceClient
+from exchange.stream import MarketStream
+from core.market import Market
+from core.paths import build_graph, graph_size, prune_markets, CycleIndex, Interner, RouteTable, find_negative_cycles, rotate_route
+from core.pricing import DepthCache, leg_rate
+from core.opportunities import OpportunityBook
+from core.scanner import ShardedScanner
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class MarketDataHub:
+    # public market data, cycle index and route scores shared by every user loop;
+    # per-user clients are only used for private endpoints.
+    # Construction does blocking REST calls and enumerates cycles: use get_hub(),
+    # which builds it in a worker thread
+    def __init__(self, client: BinanceClient | None = None):
+        self.client = client or BinanceClient()
+        self.anchors = list(settings.core_quotes)
+        self.market = Market(self.client)
+        # self.markets is the liquidity-pruned set the graph is built from;
+        # self.market.markets stays complete for order placement
+        self.markets = None
+        self.markets = self.liquid_markets(self.market.markets)
+        self.pruned_at = time.monotonic()
+        if settings.market_stream:
+            self.market.stream = self._new_stream()
+        self.graph = build_graph(self.markets)
+        self.cycles = self._load_cycles() if settings.cycle_engine == 'dfs' else None
+        self.markets_loaded_at = time.monotonic()
+        self.graph_stats = self.log_graph()
+        self.book = None
+        self.scored = []
+        self.scored_at = 0.0
+        self.depth = DepthCache(lambda s: self.market.order_book(s, settings.depth_levels), ttl=settings.depth_ttl_sec)
+        self.stream_task = None
+        self.scanner = ShardedScanner(settings.scanner_workers or None) if settings.scanner == 'processes' else None
+        self.lock = asyncio.Lock()
+        self.refresh_task = None
+
+    def _load_cycles(self):
+        path = settings.cycle_index_path
+        idx = None
+        if path and os.path.exists(path):
+            try:
+                idx = CycleIndex.load(path)
+            except Exception:
+                idx = None
+        if idx is not None and idx.anchors == self.anchors and idx.max_len == settings.max_route_len:
+            added, removed = idx.update(self.markets)
+            if not (added or removed):
+                return idx
+        else:
+            idx = CycleIndex.from_markets(self.markets, anchors=self.anchors, max_len=settings.max_route_len)
+        if path:
+            idx.save(path)
+        return idx
+
+    def liquid_markets(self, markets):
+        if not settings.liquidity_filter:
+            return markets
+        try:
+            # one bulk 24h call covers volume and spread for every symbol
+            tickers = self.client.fetch_tickers()
+        except Exception as e:
+            logger.warning(f"liquidity filter skipped, 24h tickers unavailable: {e}")
+            return self.markets if self.markets is not None else markets
+        return prune_markets(markets, tickers, settings.min_quote_volume_usdt, settings.max_spread_pct,
+                             settings.whitelist_alts, self.anchors)
+
+    def log_graph(self, prev_cycles=None):
+        full_nodes, full_edges = graph_size(build_graph(self.market.markets))
+        nodes, edges = graph_size(self.graph)
+        cycles = len(self.cycles) if self.cycles is not None else None
+        # markets/nodes/edges are unpruned -> pruned; enumerating cycles on the unpruned graph
+        # is the cost pruning avoids, so cycles are reported previous refresh -> this one
+        stats = {"markets": (len(self.market.markets), len(self.markets)), "nodes": (full_nodes, nodes),
+                 "edges": (full_edges, edges)}
+        logger.info("graph rebuilt (unpruned -> pruned): " + ", ".join(f"{k} {a} -> {b}" for k, (a, b) in stats.items())
+                    + f"; cycles (previous -> current refresh): {prev_cycles} -> {cycles}")
+        stats["cycles_previous_current"] = (prev_cycles, cycles)
+        return stats
+
+    def _new_stream(self):
+        return MarketStream.for_markets(self.markets, self.client.fetch_order_book)
+
+    def start(self):
+        if self.market.stream is not None and (self.stream_task is None or self.stream_task.done()):
+            self.stream_task = asyncio.create_task(self.market.stream.run())
+
+    def _rebuild(self, cycles):
+        # worker thread: builds the refreshed state next to the live one, which scans keep using
+        markets = self.client.load_markets()
+        liquid = self.liquid_markets(markets)
+        graph = build_graph(liquid)
+        if cycles is not None:
+            cycles = cycles.copy()
+            added, removed = cycles.update(liquid)
+            if (added or removed) and settings.cycle_index_path:
+                cycles.save(settings.cycle_index_path)
+        return markets, liquid, graph, cycles
+
+    async def refresh_markets(self):
+        prev_cycles = len(self.cycles) if self.cycles is not None else None
+        try:
+            markets, liquid, graph, cycles = await asyncio.to_thread(self._rebuild, self.cycles)
+        except Exception as e:
+            logger.warning(f"market refresh failed, keeping the current graph: {e}")
+            self.markets_loaded_at = self.pruned_at = time.monotonic()
+            return
+        # swapped in one step on the loop, so a scan never sees half a refresh
+        self.market.markets, self.markets, self.graph, self.cycles = markets, liquid, graph, cycles
+        self.markets_loaded_at = self.pruned_at = time.monotonic()
+        if self.market.stream is not None:
+            # symbols drifting across the volume threshold only touch their own subscriptions
+            await self.market.stream.update_symbols({m['id']: s for s, m in liquid.items() if m.get('active', True)})
+        self.graph_stats = await asyncio.to_thread(self.log_graph, prev_cycles)
+
+    def get_price(self, symbol, side):
+        return self.market.best_price(symbol, is_buy=(side=='buy'))
+
+    def candidate_routes(self, markets, graph, cycles):
+        # worker thread; takes the graph state as arguments since a refresh may swap it meanwhile
+        self.market.refresh_prices()
+        if cycles is not None:
+            table = cycles.table
+            bid, ask = self.market.price_vectors(table.symbols.names)
+            return table, bid, ask
+        symbols = [s for s, m in markets.items() if m.get('active', True)]
+        symbol_ids = {s: i for i, s in enumerate(symbols)}
+        bid, ask = self.market.price_vectors(symbols)
+        def rate(sym, side):
+            i = symbol_ids[sym]
+            px = ask[i] if side == 'buy' else bid[i]
+            return leg_rate(px if np.isfinite(px) else None, side)
+        routes = find_negative_cycles(graph, rate, anchors=self.anchors, max_len=settings.max_route_len)
+        table = RouteTable.from_routes(routes, Interner(symbols), width=settings.max_route_len)
+        return table, bid, ask
+
+    def score_book(self, table, bid, ask):
+        if self.book is None or self.book.table is not table or self.book.table_version != table.version:
+            self.book = OpportunityBook(table, top_k=settings.top_k_routes)
+        self.book.update(bid, ask)
+        return self.book.top()
+
+    def canonical_routes(self, scored):
+        # a cycle's score does not depend on where it starts, so each one is listed once,
+        # rotated to start at the first core quote (in CORE_QUOTES order) it passes through;
+        # depth sizing, persistence and rollups then see one stable route per cycle
+        out = []
+        for s in scored:
+            assets = {frm for (_, _, frm, _) in s['route']}
+            anchor = next((a for a in self.anchors if a in assets), None)
+            if anchor is not None:
+                out.append(dict(s, route=rotate_route(s['route'], anchor), anchor=anchor))
+        return out
+
+    async def top_routes(self):
+        # every user loop reads the same scores; they are recomputed at most once per PRICE_REFRESH_SEC
+        if time.monotonic() - self.scored_at < settings.price_refresh_sec:
+            return self.scored
+        async with self.lock:
+            # another loop may have rescored while this one waited
+            if time.monotonic() - self.scored_at < settings.price_refresh_sec:
+                return self.scored
+            now = time.monotonic()
+            if (now - self.markets_loaded_at >= settings.markets_refresh_sec or
+                    (settings.liquidity_filter and now - self.pruned_at >= settings.liquidity_refresh_sec)) and \
+                    (self.refresh_task is None or self.refresh_task.done()):
+                # scans go on with the current graph until the refreshed one is swapped in
+                self.refresh_task = asyncio.create_task(self.refresh_markets())
+            table, bid, ask = await asyncio.to_thread(self.candidate_routes, self.markets, self.graph, self.cycles)
+            if self.scanner is not None:
+                # worker processes only return routes above the profit floor
+                scored = await self.scanner.scan(table, bid, ask, settings.min_expected_profit_pct, top_k=settings.top_k_routes)
+            else:
+                scored = await asyncio.to_thread(self.score_book, table, bid, ask)
+            self.scored = self.canonical_routes(scored)
+            self.scored_at = time.monotonic()
+            return self.scored
+
+_hub = None
+_hub_lock = asyncio.Lock()
+
+async def get_hub() -> MarketDataHub:
+    global _hub
+    if _hub is None:
+        async with _hub_lock:
+            if _hub is None:
+                _hub = await asyncio.to_thread(MarketDataHub)
+    return _hub
@@ -1,10 +1,49 @@
+import time
+import numpy as np
 from exchange.binance_client import BinanceClient
 from config import settings
 
+class PriceSnapshot:
+    def __init__(self, client: BinanceClient, ttl: float = 2.0):
+        self.client = client
+        self.ttl = ttl
+        self.quotes = {}
+        self.fetched_at = 0.0
+
+    def refresh(self):
+        tickers = self.client.fetch_bids_asks()
+        self.quotes = {s: (t.get('bid'), t.get('ask')) for s, t in tickers.items()}
+        self.fetched_at = time.monotonic()
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    def bid_ask(self, symbol: str):
+        if self.age() >= self.ttl:
+            self.refresh()
+        return self.quotes.get(symbol, (None, None))
+
+    def best_price(self, symbol: str, is_buy: bool):
+        bid, ask = self.bid_ask(symbol)
+        return ask if is_buy else bid
+
+    def vectors(self, symbols):
+        if self.age() >= self.ttl:
+            self.refresh()
+        bid = np.full(len(symbols), np.nan)
+        ask = np.full(len(symbols), np.nan)
+        for i, s in enumerate(symbols):
+            b, a = self.quotes.get(s, (None, None))
+            bid[i] = b or np.nan
+            ask[i] = a or np.nan
+        return bid, ask
+
 class Market:
-    def __init__(self, client: BinanceClient):
+    def __init__(self, client: BinanceClient, prices: PriceSnapshot | None = None, stream=None):
         self.client = client
         self.markets = self.client.load_markets()
+        self.prices = prices or PriceSnapshot(client, ttl=settings.price_ttl_sec)
+        self.stream = stream
 
     def refresh(self):
         self.markets = self.client.load_markets()
@@ -15,8 +54,34 @@ class Market:
     def symbol_info(self, symbol: str):
         return self.markets.get(symbol)
 
+    def order_book(self, symbol: str, limit: int = 20):
+        if self.stream is not None:
+            book = self.stream.order_book(symbol, limit)
+            if book:
+                return book
+        return self.client.fetch_order_book(symbol, limit=limit)
+
     def best_price(self, symbol: str, is_buy: bool):
-        book = self.client.fetch_order_book(symbol, limit=5)
-        if not book:
-            return None
-        return book['asks'][0][0] if is_buy else book['bids'][0][0]
+        bid, ask = self.best_bid_ask(symbol)
+        return ask if is_buy else bid
+
+    def best_bid_ask(self, symbol: str):
+        if self.stream is not None:
+            bid, ask = self.stream.bid_ask(symbol)
+            if bid and ask:
+                return bid, ask
+        return self.prices.bid_ask(symbol)
+
+    def refresh_prices(self):
+        if self.stream is None:
+            self.prices.refresh()
+
+    def price_vectors(self, symbols):
+        if self.stream is None:
+            return self.prices.vectors(symbols)
+        bid, ask = self.stream.vectors(symbols)
+        # symbols the stream is not subscribed to are priced from the bulk snapshot
+        missing = [i for i, s in enumerate(symbols) if not self.stream.covers(s)]
+        if missing:
+            bid[missing], ask[missing] = self.prices.vectors([symbols[i] for i in missing])
+        return bid, ask
@@ -0,0 +1,93 @@
+import heapq
+import numpy as np
+from core.pricing import evaluate_routes
+
+def route_entry(table, i, gross, net, inv_gross, inv_net):
+    # the scored row for route i in whichever direction nets more
+    if net >= inv_net or np.isnan(inv_net):
+        r = table.decode(i)
+        return {"route": r, "gross_pct": float(gross), "net_pct": float(net), "length": len(r), "cycle": int(i)}
+    inv = table.decode_inverse(i)
+    return {"route": inv, "gross_pct": float(inv_gross), "net_pct": float(inv_net), "length": len(inv), "cycle": int(i), "inverted": True}
+
+class OpportunityBook:
+    def __init__(self, table, top_k=50):
+        self.table = table
+        self.table_version = table.version
+        self.legs = table.sym
+        self.buys = table.buy
+        self.top_k = top_k
+        n = len(table)
+        self.gross = np.full(n, np.nan)
+        self.net = np.full(n, np.nan)
+        self.inv_gross = np.full(n, np.nan)
+        self.inv_net = np.full(n, np.nan)
+        self.version = np.zeros(n, dtype=np.int64)
+        # symbol id -> route ids as CSR: the routes through symbol s are
+        # route_ids[sym_ptr[s]:sym_ptr[s + 1]], so a price move only rescores its own routes
+        rows, cols = np.nonzero(self.legs >= 0)
+        sids = self.legs[rows, cols]
+        order = np.argsort(sids, kind='stable')
+        self.route_ids = rows[order]
+        self.sym_ptr = np.zeros(len(table.symbols) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sids, minlength=len(table.symbols)), out=self.sym_ptr[1:])
+        self.heap = []
+        self.bid = None
+        self.ask = None
+
+    def __len__(self):
+        return len(self.table)
+
+    def update(self, bid, ask):
+        if self.bid is None or len(bid) != len(self.bid):
+            changed = np.arange(len(bid))
+        else:
+            moved_bid = (bid != self.bid) & ~(np.isnan(bid) & np.isnan(self.bid))
+            moved_ask = (ask != self.ask) & ~(np.isnan(ask) & np.isnan(self.ask))
+            changed = np.flatnonzero(moved_bid | moved_ask)
+        self.bid, self.ask = np.array(bid, dtype=float), np.array(ask, dtype=float)
+        return self._rescore_symbols(changed)
+
+    def _rescore_symbols(self, symbol_ids):
+        if not len(symbol_ids) or not len(self.legs):
+            return 0
+        symbol_ids = np.asarray(symbol_ids)
+        symbol_ids = symbol_ids[symbol_ids < len(self.sym_ptr) - 1]
+        starts, ends = self.sym_ptr[symbol_ids], self.sym_ptr[symbol_ids + 1]
+        counts = ends - starts
+        total = int(counts.sum())
+        if not total:
+            return 0
+        # concatenated CSR slices without a Python loop: each slice's offsets, shifted to its start
+        pos = np.arange(total) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        ix = np.unique(self.route_ids[pos])
+        g, n, ig, inn = evaluate_routes(self.legs[ix], self.buys[ix], self.bid, self.ask)
+        self.gross[ix], self.net[ix], self.inv_gross[ix], self.inv_net[ix] = g, n, ig, inn
+        self.version[ix] += 1
+        best = np.fmax(n, inn)
+        for i, b, v in zip(ix.tolist(), best.tolist(), self.version[ix].tolist()):
+            if b == b:
+                heapq.heappush(self.heap, (-b, i, v))
+        if len(self.heap) > 4 * len(self.table) + 1024:
+            self._compact()
+        return len(ix)
+
+    def _compact(self):
+        best = np.fmax(self.net, self.inv_net)
+        live = np.flatnonzero(~np.isnan(best))
+        self.heap = [(-best[i], int(i), int(self.version[i])) for i in live]
+        heapq.heapify(self.heap)
+
+    def _entry(self, i):
+        return route_entry(self.table, i, self.gross[i], self.net[i], self.inv_gross[i], self.inv_net[i])
+
+    def top(self, k=None):
+        k = self.top_k if k is None else k
+        picked = []
+        while self.heap and len(picked) < k:
+            item = heapq.heappop(self.heap)
+            if item[2] == self.version[item[1]]:
+                picked.append(item)
+        for item in picked:
+            heapq.heappush(self.heap, item)
+        return [self._entry(i) for (_, i, _) in picked]
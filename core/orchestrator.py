@@ -1,77 +1,123 @@
 import asyncio
-from exchange.binance_client import BinanceClient
-from core.market import Market
-from core.paths import build_graph, find_cycles, invert_route
-from core.pricing import simulate_route
+import time
+from core.pricing import optimal_notional
 from core.risk import Risk
 from core.executor import Executor
+from core.persistence import get_writer, recent_rollups
+from exchange.user_stream import BalanceCache
 from db.session import AsyncSessionLocal
-from db.models import Opportunity, Trade, FeeLedger, AccountSetting, ApiKey, User
+from db.models import Trade, FeeLedger, AccountSetting, ApiKey, User
 from config import settings
 from telegram_bot.notifier import send_user_message
-from core.ai_assist import summarize_market
+from core.ai_assist import summarize_rollups
 import sqlalchemy
 
 class UserOrchestrator:
-    def __init__(self, user_id, api_key, api_secret, trade_amount):
+    def __init__(self, user_id, api_key, api_secret, trade_amount, hub, inventory_targets=None):
+        # hub: the shared core.hub.MarketDataHub, from `await get_hub()`
         self.user_id = user_id
-        self.client = BinanceClient(api_key, api_secret)
-        self.market = Market(self.client)
-        self.markets = self.market.markets
-        self.graph = build_graph(self.markets)
+        self.hub = hub
+        self.market = self.hub.market
+        # every listed market, not just the liquid set the hub searches, so any order can be placed
+        self.markets = self.hub.market.markets
         self.risk = Risk(self.markets)
-        self.executor = Executor(self.markets, api_key, api_secret)
+        self.executor = Executor(self.markets, api_key, api_secret, prices=self.market, inventory_targets=inventory_targets)
+        if settings.user_stream:
+            self.executor.balances = BalanceCache.for_ccxt(self.executor.client)
+        self.rebalance_due = False
+        self.rebalanced_at = 0.0
         self.trade_amount = min(trade_amount, settings.max_invest_usd)
+        self.writer = get_writer()
+        self.scan_stats = {"scans": 0, "last_ms": 0.0, "avg_ms": 0.0, "max_ms": 0.0}
 
     def get_price(self, symbol, side):
         return self.market.best_price(symbol, is_buy=(side=='buy'))
 
-    async def scan_and_execute_once(self):
-        routes = []
-        for L in (3,4,5):
-            routes += find_cycles(self.graph, start='USDT', max_len=L)
-        scored = []
-        for r in routes:
-            sim = simulate_route(r, self.get_price)
-            if not sim:
+    def size_by_depth(self, candidates, limit):
+        # worker thread: a depth-cache miss is a blocking REST order book call per leg, so
+        # candidates are sized best first and only until `limit` routes survive sizing
+        sized = []
+        for s in sorted(candidates, key=lambda x: x['net_pct'], reverse=True):
+            if len(sized) >= limit:
+                break
+            # depth is walked in the anchor asset; notional and profit are reported in USDT
+            anchor = s.get('anchor', 'USDT')
+            px = 1.0 if anchor == 'USDT' else self.get_price(f"{anchor}/USDT", 'sell')
+            if not px:
+                continue
+            opt = optimal_notional(s['route'], self.hub.depth.get, self.trade_amount / px, min_notional=settings.leg_notional_usdt / px)
+            if not opt or opt['net_pct'] < settings.min_expected_profit_pct:
                 continue
-            gross, net = sim
-            scored.append({"route": r, "gross_pct": gross, "net_pct": net, "length": len(r)})
-            if net < 0:
-                inv = invert_route(r)
-                sim2 = simulate_route(inv, self.get_price)
-                if sim2:
-                    g2,n2 = sim2
-                    scored.append({"route": inv, "gross_pct": g2, "net_pct": n2, "length": len(inv), "inverted": True})
+            sized.append(dict(s, gross_pct=opt['gross_pct'], net_pct=opt['net_pct'], notional=opt['notional'] * px, profit_usdt=opt['profit'] * px))
+        return sized
+
+    def _record_scan(self, started):
+        ms = (time.perf_counter() - started) * 1000
+        st = self.scan_stats
+        st["scans"] += 1
+        st["last_ms"] = round(ms, 3)
+        st["avg_ms"] = round(st["avg_ms"] + (ms - st["avg_ms"]) / st["scans"], 3)
+        st["max_ms"] = round(max(st["max_ms"], ms), 3)
+
+    async def scan_and_execute_once(self):
+        started = time.perf_counter()
+        scored = await self.hub.top_routes()
+        if self.hub.market.markets is not self.markets:
+            self.markets = self.risk.markets = self.hub.market.markets
+            self.executor.set_markets(self.markets)
         good = [s for s in scored if s['net_pct'] >= settings.min_expected_profit_pct]
+        if settings.depth_aware:
+            good = await asyncio.to_thread(self.size_by_depth, good, settings.max_concurrent_routes)
         good.sort(key=lambda x: x['net_pct'], reverse=True)
         good = good[:settings.max_concurrent_routes]
 
+        # opportunity rows are written behind; the scan only enqueues them
+        self.writer.submit(self.user_id, scored, scan_id=self.hub.scored_at)
+        self._record_scan(started)
+
         results = []
         async with AsyncSessionLocal() as session:
-            for s in scored:
-                opp = Opportunity(user_id=self.user_id, length=s['length'], route=str([x[0] for x in s['route']]), expected_gross_pct=s['gross_pct'], expected_net_pct=s['net_pct'], viable=(s['net_pct']>=settings.min_expected_profit_pct))
-                session.add(opp)
-            await session.commit()
-
             for s in good:
-                can, reason = self.risk.can_execute(s['route'], self.get_price, self.trade_amount)
+                notional = s.get('notional', self.trade_amount)
+                can, reason = self.risk.can_execute(s['route'], self.get_price, notional)
                 if not can:
                     await send_user_message(self.user_id, f"تم تخطي المسار: {[x[0] for x in s['route']]} السبب: {reason}")
                     continue
-                res = self.executor.execute_route(s['route'], self.trade_amount)
-                t = Trade(user_id=self.user_id, route=str([x[0] for x in s['route']]), length=s['length'], notional_usdt=self.trade_amount, gross_pct=s['gross_pct'], net_pct=s['net_pct'], status='success' if res.get('ok') else 'failed', details=res)
+                res = self.executor.execute_route(s['route'], notional)
+                if res.get('mode') == 'inventory':
+                    self.rebalance_due = True
+                t = Trade(user_id=self.user_id, route=str([x[0] for x in s['route']]), length=s['length'], notional_usdt=notional, gross_pct=s['gross_pct'], net_pct=s['net_pct'], status='success' if res.get('ok') else 'failed', details=res)
                 session.add(t)
                 await session.commit()
                 results.append((s,res))
-            summary = await summarize_market(scored)
+            summary = await summarize_rollups(await recent_rollups(minutes=settings.summary_window_min))
             await send_user_message(self.user_id, f"ملخّص السوق:\n{summary}")
         return results
 
+    async def rebalance_inventory(self):
+        # inventory-mode routes leave the legs' assets off target; restore them on a slow schedule
+        if not self.rebalance_due or time.monotonic() - self.rebalanced_at < settings.inventory_rebalance_sec:
+            return []
+        orders = await asyncio.to_thread(self.executor.rebalance)
+        self.rebalance_due = False
+        self.rebalanced_at = time.monotonic()
+        if orders:
+            await send_user_message(self.user_id, f"إعادة موازنة المخزون: {[(o['asset'], o['side'], o['amt']) for o in orders]}")
+        return orders
+
     async def run_loop(self):
-        while True:
-            try:
-                await self.scan_and_execute_once()
-            except Exception as e:
-                await send_user_message(self.user_id, f"خطأ في الأوركستريتور: {e}")
-            await asyncio.sleep(1.5)
+        self.hub.start()
+        self.writer.start()
+        if self.executor.balances is not None:
+            self.executor.balances.start()
+        try:
+            while True:
+                try:
+                    await self.scan_and_execute_once()
+                    await self.rebalance_inventory()
+                except Exception as e:
+                    await send_user_message(self.user_id, f"خطأ في الأوركستريتور: {e}")
+                await asyncio.sleep(1.5)
+        finally:
+            if self.executor.balances is not None:
+                self.executor.balances.stop()
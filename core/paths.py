@@ -1,15 +1,63 @@
+import json
+import math
+from array import array
 from collections import defaultdict
+import numpy as np
 
-def build_graph(markets):
+def _active_pairs(markets):
+    return {s: (m['base'], m['quote']) for s, m in markets.items() if m.get('active', True)}
+
+def _graph_from_pairs(pairs):
     graph = defaultdict(list)
-    for s, m in markets.items():
-        if not m.get('active', True):
-            continue
-        base, quote = m['base'], m['quote']
+    for s, (base, quote) in pairs.items():
         graph[quote].append((base, s, 'buy'))
         graph[base].append((quote, s, 'sell'))
     return graph
 
+def build_graph(markets):
+    return _graph_from_pairs(_active_pairs(markets))
+
+def graph_size(graph):
+    return len(graph), sum(len(edges) for edges in graph.values())
+
+def _usdt_rates(tickers, quotes):
+    # USDT value of one unit of each quote asset, from the same 24h tickers
+    rates = {'USDT': 1.0}
+    for q in quotes:
+        t = tickers.get(f"{q}/USDT")
+        if t and t.get('last'):
+            rates[q] = t['last']
+            continue
+        t = tickers.get(f"USDT/{q}")
+        if t and t.get('last'):
+            rates[q] = 1.0 / t['last']
+    return rates
+
+def prune_markets(markets, tickers, min_quote_volume_usdt=0.0, max_spread_pct=0.0, whitelist=(), core_quotes=()):
+    # drops markets that never fill before any graph is built: 24h quote volume below the floor
+    # (valued in USDT), bid/ask spread above the ceiling, or, with a whitelist, any asset that
+    # is neither a core quote nor whitelisted; a market without a ticker is dropped
+    allowed = set(whitelist) | set(core_quotes) if whitelist else None
+    pairs = _active_pairs(markets)
+    rates = _usdt_rates(tickers, {q for (_, q) in pairs.values()})
+    kept = {}
+    for s, (base, quote) in pairs.items():
+        if allowed is not None and not (base in allowed and quote in allowed):
+            continue
+        t = tickers.get(s)
+        if not t:
+            continue
+        if min_quote_volume_usdt:
+            rate = rates.get(quote)
+            if not rate or (t.get('quoteVolume') or 0.0) * rate < min_quote_volume_usdt:
+                continue
+        if max_spread_pct:
+            bid, ask = t.get('bid'), t.get('ask')
+            if not bid or not ask or (ask - bid) / ((ask + bid) / 2) * 100 > max_spread_pct:
+                continue
+        kept[s] = markets[s]
+    return kept
+
 def find_cycles(graph, start='USDT', max_len=3):
     routes = []
     def dfs(curr, path, depth):
@@ -29,3 +77,282 @@ def invert_route(route):
     for (sym, side, frm, to) in route[::-1]:
         inv.append((sym, 'buy' if side=='sell' else 'sell', to, frm))
     return inv
+
+def rotate_route(route, anchor):
+    # same cycle, starting and ending at anchor
+    for i, (sym, side, frm, to) in enumerate(route):
+        if frm == anchor:
+            return route[i:] + route[:i]
+    return None
+
+def cycle_key(route):
+    # identical for every rotation and for the inverse direction of the same cycle
+    variants = []
+    for legs in (route, invert_route(route)):
+        pairs = [(sym, side) for (sym, side, frm, to) in legs]
+        for i in range(len(pairs)):
+            variants.append(tuple(pairs[i:] + pairs[:i]))
+    return min(variants)
+
+def _simple_paths(graph, src, dst, max_edges, avoid=frozenset()):
+    paths = []
+    def dfs(curr, path, seen):
+        if curr == dst:
+            paths.append(path)
+            return
+        if len(path) == max_edges:
+            return
+        for (nxt, sym, side) in graph.get(curr, []):
+            if nxt in seen or nxt in avoid:
+                continue
+            dfs(nxt, path + [(sym, side, curr, nxt)], seen | {nxt})
+    dfs(src, [], {src})
+    return paths
+
+def _cycles_through_leg(graph, anchor, leg, max_len):
+    sym, side, frm, to = leg
+    routes = []
+    for prefix in _simple_paths(graph, anchor, frm, max_len - 1, avoid={to} - {anchor}):
+        used = {f for (_, _, f, _) in prefix} | {frm}
+        for suffix in _simple_paths(graph, to, anchor, max_len - 1 - len(prefix), avoid=used - {anchor}):
+            route = prefix + [leg] + suffix
+            if len(route) >= 3:
+                routes.append(route)
+    return routes
+
+def find_negative_cycles(graph, rate_fn, anchors=('USDT',), max_len=5):
+    # hop-bounded Bellman-Ford: edges weigh -log(rate), one relaxation round per leg,
+    # keeping the lightest simple path per asset; a closing edge back to the anchor
+    # with negative total weight is a profitable cycle. Cost is O(max_len * edges).
+    weights = {}
+    for frm, edges in graph.items():
+        for (to, sym, side) in edges:
+            rate = rate_fn(sym, side)
+            if rate and rate > 0:
+                weights[(sym, side)] = -math.log(rate)
+    found = {}
+    for anchor in anchors:
+        layer = {anchor: (0.0, [])}
+        for depth in range(1, max_len + 1):
+            nxt_layer = {}
+            for u, (du, path) in layer.items():
+                visited = {f for (_, _, f, _) in path}
+                for (v, sym, side) in graph.get(u, []):
+                    w = weights.get((sym, side))
+                    if w is None:
+                        continue
+                    d = du + w
+                    leg = (sym, side, u, v)
+                    if v == anchor:
+                        if depth >= 3 and d < 0:
+                            key = cycle_key(path + [leg])
+                            if key not in found or d < found[key][0]:
+                                found[key] = (d, path + [leg])
+                        continue
+                    if v in visited:
+                        continue
+                    if v not in nxt_layer or d < nxt_layer[v][0]:
+                        nxt_layer[v] = (d, path + [leg])
+            layer = nxt_layer
+    return [route for (d, route) in sorted(found.values(), key=lambda x: x[0])]
+
+LEG_DTYPE = np.dtype([('sym', np.int32), ('buy', np.bool_), ('frm', np.int32), ('to', np.int32)])
+
+class Interner:
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.id(name)
+
+    def id(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def __len__(self):
+        return len(self.names)
+
+    def copy(self):
+        other = Interner()
+        other.names = list(self.names)
+        other.ids = dict(self.ids)
+        return other
+
+class RouteTable:
+    # routes as fixed-width rows of (symbol id, buy flag, from/to asset id) legs,
+    # padded with sym=-1; strings only come back through decode()
+    def __init__(self, width=5, symbols=None, assets=None):
+        self.symbols = symbols or Interner()
+        self.assets = assets or Interner()
+        self.legs = self._empty(0, width)
+        self.size = 0
+        self.version = 0
+
+    @staticmethod
+    def _empty(rows, width):
+        legs = np.zeros((rows, width), dtype=LEG_DTYPE)
+        legs['sym'] = -1
+        return legs
+
+    @classmethod
+    def from_routes(cls, routes, symbols=None, width=None):
+        table = cls(width or max((len(r) for r in routes), default=1), symbols)
+        for route in routes:
+            table.add(route)
+        return table
+
+    def encode(self, route):
+        return [(self.symbols.id(sym), side == 'buy', self.assets.id(frm), self.assets.id(to)) for (sym, side, frm, to) in route]
+
+    def append(self, legs):
+        if self.size == len(self.legs):
+            grown = self._empty(max(1024, 2 * len(self.legs)), self.legs.shape[1])
+            grown[:self.size] = self.legs[:self.size]
+            self.legs = grown
+        self.legs[self.size, :len(legs)] = legs
+        self.size += 1
+        self.version += 1
+        return self.size - 1
+
+    def add(self, route):
+        return self.append(self.encode(route))
+
+    def keep(self, mask):
+        self.legs = self.legs[:self.size][mask]
+        self.size = len(self.legs)
+        self.version += 1
+
+    @property
+    def sym(self):
+        return self.legs['sym'][:self.size]
+
+    @property
+    def buy(self):
+        return self.legs['buy'][:self.size]
+
+    def decode(self, i):
+        route = []
+        for sym, buy, frm, to in self.legs[i].tolist():
+            if sym < 0:
+                break
+            route.append((self.symbols.names[sym], 'buy' if buy else 'sell', self.assets.names[frm], self.assets.names[to]))
+        return route
+
+    def copy(self):
+        other = RouteTable(self.legs.shape[1], self.symbols.copy(), self.assets.copy())
+        other.legs = self.legs.copy()
+        other.size = self.size
+        other.version = self.version
+        return other
+
+    def decode_inverse(self, i):
+        return invert_route(self.decode(i))
+
+    def __len__(self):
+        return self.size
+
+def _code_key(codes):
+    # codes are sym_id*2 + buy; inverting a route reverses it and flips every buy bit
+    inv = [c ^ 1 for c in reversed(codes)]
+    best = min(tuple(c[i:] + c[:i]) for c in (codes, inv) for i in range(len(c)))
+    return array('i', best).tobytes()
+
+class CycleIndex:
+    def __init__(self, anchors=('USDT',), max_len=5):
+        self.anchors = list(anchors)
+        self.max_len = max_len
+        self.pairs = {}
+        self.table = RouteTable(max_len)
+        self.keys = {}
+        self.row_keys = []
+
+    @classmethod
+    def from_markets(cls, markets, anchors=('USDT',), max_len=5):
+        idx = cls(anchors, max_len)
+        idx.pairs = _active_pairs(markets)
+        graph = _graph_from_pairs(idx.pairs)
+        for anchor in idx.anchors:
+            idx._enumerate(graph, anchor)
+        return idx
+
+    def _enumerate(self, graph, anchor):
+        def dfs(curr, path, seen):
+            for (nxt, sym, side) in graph.get(curr, []):
+                leg = (sym, side, curr, nxt)
+                if nxt == anchor and len(path) >= 2:
+                    self._add(path + [leg])
+                elif nxt not in seen and len(path) + 1 < self.max_len:
+                    dfs(nxt, path + [leg], seen | {nxt})
+        dfs(anchor, [], {anchor})
+
+    def _add(self, route):
+        self._add_encoded(self.table.encode(route))
+
+    def _add_encoded(self, legs):
+        key = _code_key([sym * 2 + buy for (sym, buy, frm, to) in legs])
+        if key not in self.keys:
+            self.keys[key] = self.table.append(legs)
+            self.row_keys.append(key)
+
+    def route(self, i):
+        return self.table.decode(i)
+
+    def copy(self):
+        # refreshes update a copy off the event loop while scans keep reading the original
+        other = CycleIndex(self.anchors, self.max_len)
+        other.pairs = dict(self.pairs)
+        other.table = self.table.copy()
+        other.keys = dict(self.keys)
+        other.row_keys = list(self.row_keys)
+        return other
+
+    def __len__(self):
+        return len(self.table)
+
+    def update(self, markets):
+        new_pairs = _active_pairs(markets)
+        removed = {s for s, p in self.pairs.items() if new_pairs.get(s) != p}
+        added = {s for s, p in new_pairs.items() if self.pairs.get(s) != p}
+        removed_ids = [self.table.symbols.ids[s] for s in removed if s in self.table.symbols.ids]
+        if removed_ids:
+            mask = ~np.isin(self.table.sym, removed_ids).any(axis=1)
+            self.table.keep(mask)
+            self.row_keys = [k for k, alive in zip(self.row_keys, mask.tolist()) if alive]
+            self.keys = {k: i for i, k in enumerate(self.row_keys)}
+        self.pairs = new_pairs
+        if added:
+            graph = _graph_from_pairs(new_pairs)
+            for s in added:
+                base, quote = new_pairs[s]
+                for anchor in self.anchors:
+                    for route in _cycles_through_leg(graph, anchor, (s, 'buy', quote, base), self.max_len):
+                        self._add(route)
+        return added, removed
+
+    def save(self, path):
+        meta = {'anchors': self.anchors, 'max_len': self.max_len, 'pairs': self.pairs}
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                legs=self.table.legs[:self.table.size],
+                symbols=np.array(self.table.symbols.names, dtype=str),
+                assets=np.array(self.table.assets.names, dtype=str),
+                meta=np.array(json.dumps(meta)),
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = np.load(f, allow_pickle=False)
+            meta = json.loads(str(data['meta']))
+            idx = cls(meta['anchors'], meta['max_len'])
+            idx.pairs = {s: tuple(p) for s, p in meta['pairs'].items()}
+            idx.table.symbols = Interner(str(s) for s in data['symbols'])
+            idx.table.assets = Interner(str(a) for a in data['assets'])
+            legs = data['legs']
+        for row in legs.tolist():
+            idx._add_encoded([leg for leg in row if leg[0] >= 0])
+        return idx
@@ -0,0 +1,217 @@
+import asyncio
+import contextlib
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from db.session import engine
+from db.models import Opportunity, OpportunityRollup
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+def sample_opportunities(scored, policy=None, top_n=None):
+    # which scored routes are worth a row: 'viable' (above the profit floor), 'top' (best N) or 'all'.
+    # `scored` is what the hub returned, i.e. its TOP_K_ROUTES best routes, so 'all' means all
+    # of those, not every route in the cycle index
+    policy = policy or settings.opportunity_sampling
+    if policy == 'all':
+        return scored
+    if policy == 'top':
+        return sorted(scored, key=lambda s: s['net_pct'], reverse=True)[:top_n or settings.opportunity_top_n]
+    return [s for s in scored if s['net_pct'] >= settings.min_expected_profit_pct]
+
+def _route_name(s):
+    return str([x[0] for x in s['route']])
+
+class OpportunityWriter:
+    # write-behind for opportunity rows: scans enqueue without waiting, a single
+    # background task flushes multi-row INSERTs when a batch fills or ages out;
+    # when the queue is full new rows are dropped (and counted) rather than blocking the scan.
+    # Every submitted route (the hub's top TOP_K_ROUTES), sampled or not, also lands in
+    # per-route per-minute rollups that are upserted in the same flush.
+    def __init__(self, queue_size=None, batch_size=None, flush_sec=None, report_sec=60.0):
+        self.queue = asyncio.Queue(maxsize=queue_size or settings.opportunity_queue_size)
+        self.batch_size = batch_size or settings.opportunity_batch_size
+        self.flush_sec = flush_sec or settings.opportunity_flush_sec
+        self.report_sec = report_sec
+        self.task = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.rollups_written = 0
+        self.batches = 0
+        self.flush_seconds = 0.0
+        self.reported_at = time.monotonic()
+        # (minute, route) -> [length, samples, viable, sum, min, max]
+        self.rollups = {}
+        self.rolled_scan = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def submit(self, user_id, scored, scan_id=None):
+        # scan_id identifies one hub scan; every user loop sees the same scores, so they are rolled up once
+        now = datetime.utcnow()
+        if scan_id is None or scan_id != self.rolled_scan:
+            self.rolled_scan = scan_id
+            self._roll_up(now, scored)
+        for s in sample_opportunities(scored):
+            row = {
+                "user_id": user_id,
+                "created_at": now,
+                "length": s['length'],
+                "route": _route_name(s),
+                "expected_gross_pct": s['gross_pct'],
+                "expected_net_pct": s['net_pct'],
+                "viable": s['net_pct'] >= settings.min_expected_profit_pct,
+            }
+            try:
+                self.queue.put_nowait(row)
+                self.enqueued += 1
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def _roll_up(self, now, scored):
+        minute = now.replace(second=0, microsecond=0)
+        for s in scored:
+            net = s['net_pct']
+            key = (minute, _route_name(s))
+            agg = self.rollups.get(key)
+            if agg is None:
+                self.rollups[key] = [s['length'], 1, int(net >= settings.min_expected_profit_pct), net, net, net]
+                continue
+            agg[1] += 1
+            agg[2] += net >= settings.min_expected_profit_pct
+            agg[3] += net
+            agg[4] = min(agg[4], net)
+            agg[5] = max(agg[5], net)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = []
+                deadline = loop.time() + self.flush_sec
+                while len(batch) < self.batch_size:
+                    while len(batch) < self.batch_size and not self.queue.empty():
+                        batch.append(self.queue.get_nowait())
+                    timeout = deadline - loop.time()
+                    if len(batch) >= self.batch_size or timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                if batch or self.rollups:
+                    await self.flush(batch)
+        finally:
+            # drain what is left on shutdown
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if batch or self.rollups:
+                await asyncio.shield(self.flush(batch))
+
+    async def stop(self):
+        # shutdown hook: cancelling the flush loop runs its drain; without a loop, flush here
+        task, self.task = self.task, None
+        if task is not None and not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+            return
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch or self.rollups:
+            await self.flush(batch)
+
+    def _rollup_upsert(self, rollups):
+        stmt = mysql_insert(OpportunityRollup).values([
+            {"minute": minute, "route": route, "length": length, "samples": n, "viable": viable,
+             "sum_net_pct": total, "min_net_pct": lo, "max_net_pct": hi}
+            for (minute, route), (length, n, viable, total, lo, hi) in rollups.items()
+        ])
+        return stmt.on_duplicate_key_update(
+            samples=OpportunityRollup.samples + stmt.inserted.samples,
+            viable=OpportunityRollup.viable + stmt.inserted.viable,
+            sum_net_pct=OpportunityRollup.sum_net_pct + stmt.inserted.sum_net_pct,
+            min_net_pct=func.least(OpportunityRollup.min_net_pct, stmt.inserted.min_net_pct),
+            max_net_pct=func.greatest(OpportunityRollup.max_net_pct, stmt.inserted.max_net_pct),
+        )
+
+    async def flush(self, batch):
+        started = time.perf_counter()
+        rollups, self.rollups = self.rollups, {}
+        try:
+            async with engine.begin() as conn:
+                if batch:
+                    await conn.execute(insert(Opportunity).values(batch))
+                if rollups:
+                    await conn.execute(self._rollup_upsert(rollups))
+            self.written += len(batch)
+            self.rollups_written += len(rollups)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning(f"opportunity flush of {len(batch)} rows / {len(rollups)} rollups failed: {e}")
+        self.flush_seconds += time.perf_counter() - started
+        if time.monotonic() - self.reported_at >= self.report_sec:
+            self.reported_at = time.monotonic()
+            logger.info(f"opportunity writer: {self.stats()}")
+
+    def stats(self):
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "rollups_written": self.rollups_written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queued": self.queue.qsize(),
+            "batches": self.batches,
+            "rows_per_batch": round(self.written / self.batches, 1) if self.batches else 0.0,
+            "insert_rows_per_sec": round(self.written / self.flush_seconds) if self.flush_seconds else 0,
+        }
+
+_rollup_reads = {}
+
+async def recent_rollups(minutes=60, limit=20, ttl=60.0):
+    # best routes over the last `minutes`, aggregated from the per-minute rollups;
+    # cached for `ttl` seconds since every user loop asks for the same summary
+    hit = _rollup_reads.get((minutes, limit))
+    if hit and time.monotonic() - hit[0] < ttl:
+        return hit[1]
+    since = datetime.utcnow() - timedelta(minutes=minutes)
+    r = OpportunityRollup
+    q = (
+        select(
+            r.route,
+            func.max(r.length).label("length"),
+            func.sum(r.samples).label("samples"),
+            func.sum(r.viable).label("viable"),
+            (func.sum(r.sum_net_pct) / func.sum(r.samples)).label("avg_net_pct"),
+            func.min(r.min_net_pct).label("min_net_pct"),
+            func.max(r.max_net_pct).label("max_net_pct"),
+        )
+        .where(r.minute >= since)
+        .group_by(r.route)
+        .order_by(func.max(r.max_net_pct).desc())
+        .limit(limit)
+    )
+    async with engine.connect() as conn:
+        rows = [dict(row) for row in (await conn.execute(q)).mappings().all()]
+    _rollup_reads[(minutes, limit)] = (time.monotonic(), rows)
+    return rows
+
+_writer = None
+
+def get_writer() -> OpportunityWriter:
+    global _writer
+    if _writer is None:
+        _writer = OpportunityWriter()
+    return _writer
@@ -1,5 +1,8 @@
+import time
+import numpy as np
 from config import settings
 FEES = {"taker": 0.001}
+GOLDEN = (5 ** 0.5 - 1) / 2
 
 def simulate_route(route_legs, get_price_fn):
     notional = settings.leg_notional_usdt
@@ -21,3 +24,121 @@ def simulate_route(route_legs, get_price_fn):
     gross_pct = (value - notional) / notional * 100
     net_pct = gross_pct - fees_total_pct
     return gross_pct, net_pct
+
+def leg_rate(px, side):
+    if not px:
+        return None
+    fee = FEES['taker']
+    if side == 'buy':
+        return (1 - fee) / (px * (1 + settings.max_slippage_pct/100.0))
+    return px * (1 - settings.max_slippage_pct/100.0) * (1 - fee)
+
+def log_returns(legs, buys, bid, ask):
+    # log of what one unit of the start asset comes back as along each route and along its
+    # reverse, before fees: buy legs pay the ask, sell legs receive the bid.
+    # legs: route x leg symbol indices (-1 pads short routes), buys: same shape, True for buy legs
+    # bid/ask: price vectors indexed by symbol id, missing prices as nan or <= 0 (the route comes out nan)
+    # Returns (forward, reverse, legs per route).
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_bid = np.log(np.where(bid > 0, bid, np.nan))
+        log_ask = np.log(np.where(ask > 0, ask, np.nan))
+    valid = legs >= 0
+    idx = np.where(valid, legs, 0)
+    lb, la = log_bid[idx], log_ask[idx]
+    fwd = np.where(valid, np.where(buys, -la, lb), 0.0).sum(axis=1)
+    inv = np.where(valid, np.where(buys, lb, -la), 0.0).sum(axis=1)
+    return fwd, inv, valid.sum(axis=1)
+
+def evaluate_routes(legs, buys, bid, ask):
+    # gross/net percent for each route and its reverse, with MAX_SLIPPAGE_PCT on every price
+    slip = settings.max_slippage_pct/100.0
+    fwd, inv, lengths = log_returns(legs, buys, np.asarray(bid) * (1 - slip), np.asarray(ask) * (1 + slip))
+    fees_total_pct = lengths * FEES['taker']*100
+    gross_pct = np.expm1(fwd) * 100
+    inv_gross_pct = np.expm1(inv) * 100
+    return gross_pct, gross_pct - fees_total_pct, inv_gross_pct, inv_gross_pct - fees_total_pct
+
+def _depth_levels(levels):
+    if not levels:
+        return None
+    book = np.asarray([lvl[:2] for lvl in levels], dtype=float)
+    px, qty = book[:, 0], book[:, 1]
+    return px, np.cumsum(qty), np.cumsum(px * qty)
+
+class DepthCache:
+    def __init__(self, fetch_book_fn, ttl=1.0):
+        self.fetch_book_fn = fetch_book_fn
+        self.ttl = ttl
+        self.books = {}
+
+    def get(self, symbol):
+        hit = self.books.get(symbol)
+        now = time.monotonic()
+        if hit and now - hit[0] < self.ttl:
+            return hit[1]
+        book = self.fetch_book_fn(symbol)
+        depth = None
+        if book:
+            depth = {'bids': _depth_levels(book.get('bids')), 'asks': _depth_levels(book.get('asks'))}
+        self.books[symbol] = (now, depth)
+        return depth
+
+    def invalidate(self, symbol=None):
+        if symbol is None:
+            self.books.clear()
+        else:
+            self.books.pop(symbol, None)
+
+def fill_leg(depth, side, value):
+    # buy: spend value quote walking the asks; sell: sell value base walking the bids
+    levels = depth.get('asks' if side == 'buy' else 'bids') if depth else None
+    if levels is None:
+        return None
+    px, cum_qty, cum_quote = levels
+    spent = cum_quote if side == 'buy' else cum_qty
+    i = int(np.searchsorted(spent, value))
+    if i >= len(px):
+        return None
+    done_qty = cum_qty[i-1] if i else 0.0
+    done_quote = cum_quote[i-1] if i else 0.0
+    if side == 'buy':
+        return done_qty + (value - done_quote) / px[i]
+    return done_quote + (value - done_qty) * px[i]
+
+def simulate_route_depth(route_legs, get_depth_fn, notional):
+    value = notional
+    for (symbol, side, frm, to) in route_legs:
+        value = fill_leg(get_depth_fn(symbol), side, value)
+        if not value:
+            return None
+    gross_pct = float((value - notional) / notional * 100)
+    net_pct = gross_pct - FEES['taker']*100*len(route_legs)
+    return gross_pct, net_pct
+
+def optimal_notional(route_legs, get_depth_fn, max_notional, min_notional=None, iterations=24):
+    # profit = notional * net_pct shrinks as fills walk deeper, so golden-section search it
+    lo = min(min_notional or settings.leg_notional_usdt, max_notional)
+    hi = max_notional
+    def profit(n):
+        sim = simulate_route_depth(route_legs, get_depth_fn, n)
+        return (n * sim[1] / 100, sim) if sim else (float('-inf'), None)
+    best = max((profit(lo) + (lo,), profit(hi) + (hi,)), key=lambda x: x[0])
+    a, b = lo, hi
+    c, d = b - GOLDEN * (b - a), a + GOLDEN * (b - a)
+    pc, pd = profit(c), profit(d)
+    for _ in range(iterations):
+        if pc[0] >= pd[0]:
+            b, d, pd = d, c, pc
+            c = b - GOLDEN * (b - a)
+            pc = profit(c)
+        else:
+            a, c, pc = c, d, pd
+            d = a + GOLDEN * (b - a)
+            pd = profit(d)
+    for (p, sim), n in ((pc, c), (pd, d)):
+        if p > best[0]:
+            best = (p, sim, n)
+    p, sim, n = best
+    if sim is None:
+        return None
+    return {"notional": n, "gross_pct": sim[0], "net_pct": sim[1], "profit": p}
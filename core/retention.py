@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+from db.session import engine
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+TABLE = "opportunities"
+
+def _name(day: date):
+    return f"p{day:%Y%m%d}"
+
+def _less_than(day: date):
+    # partition p<day> holds rows created on <day>
+    return f"TO_DAYS('{day + timedelta(days=1):%Y-%m-%d}')"
+
+async def _partitions(conn):
+    q = await conn.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL"
+    ), {"t": TABLE})
+    return [row[0] for row in q.fetchall()]
+
+async def ensure_partitions(conn, today: date, days_ahead: int):
+    # one RANGE partition per day plus a catch-all; the first run converts the table in place
+    # (tables created before created_at joined the primary key get their key rebuilt too)
+    existing = await _partitions(conn)
+    wanted = [today + timedelta(days=i) for i in range(days_ahead + 1)]
+    if not existing:
+        parts = ", ".join(f"PARTITION {_name(d)} VALUES LESS THAN ({_less_than(d)})" for d in wanted)
+        await conn.execute(text(
+            f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at) "
+            f"PARTITION BY RANGE (TO_DAYS(created_at)) "
+            f"({parts}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        ))
+        return [_name(d) for d in wanted]
+    last = max((p for p in existing if p != 'pmax'), default='')
+    missing = [d for d in wanted if _name(d) > last]
+    if missing:
+        parts = ", ".join(f"PARTITION {_name(d)} VALUES LESS THAN ({_less_than(d)})" for d in missing)
+        await conn.execute(text(
+            f"ALTER TABLE {TABLE} REORGANIZE PARTITION pmax INTO "
+            f"({parts}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        ))
+    return [_name(d) for d in missing]
+
+async def drop_expired(conn, today: date, retention_days: int):
+    # dropping a partition is a metadata change, unlike DELETE over millions of rows
+    cutoff = _name(today - timedelta(days=retention_days))
+    expired = [p for p in await _partitions(conn) if p != 'pmax' and p < cutoff]
+    if expired:
+        await conn.execute(text(f"ALTER TABLE {TABLE} DROP PARTITION {', '.join(expired)}"))
+    return expired
+
+async def maintain_partitions(today: date | None = None):
+    # created_at is written in UTC
+    today = today or datetime.utcnow().date()
+    async with engine.begin() as conn:
+        added = await ensure_partitions(conn, today, settings.partition_days_ahead)
+        dropped = await drop_expired(conn, today, settings.opportunity_retention_days)
+    if added or dropped:
+        logger.info(f"{TABLE} partitions: added {added}, dropped {dropped}")
+    return added, dropped
+
+async def run_retention_loop():
+    while True:
+        try:
+            await maintain_partitions()
+        except Exception as e:
+            logger.warning(f"partition maintenance failed: {e}")
+        await asyncio.sleep(settings.retention_check_sec)
@@ -0,0 +1,100 @@
+import asyncio
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from core.pricing import evaluate_routes
+from core.opportunities import route_entry
+
+class SharedArray:
+    # numpy array in a named shared-memory block; workers attach to it by name instead of receiving a copy
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+        self.spec = (self.shm.name, tuple(shape), dtype)
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+
+# worker side: role -> (block name, SharedMemory, array view)
+_attached = {}
+
+def _attach(role, spec):
+    name, shape, dtype = spec
+    hit = _attached.get(role)
+    if hit is None or hit[0] != name:
+        if hit is not None:
+            old = _attached.pop(role)[1]
+            hit = None
+            try:
+                old.close()
+            except BufferError:
+                pass
+        shm = shared_memory.SharedMemory(name=name)
+        hit = _attached[role] = (name, shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return hit[2]
+
+def _scan_shard(legs_spec, prices_spec, start, stop, threshold):
+    legs = _attach('legs', legs_spec)[start:stop]
+    prices = _attach('prices', prices_spec)
+    gross, net, inv_gross, inv_net = evaluate_routes(legs['sym'], legs['buy'], prices[0], prices[1])
+    hit = np.flatnonzero(np.fmax(net, inv_net) >= threshold)
+    return start + hit, gross[hit], net[hit], inv_gross[hit], inv_net[hit]
+
+class ShardedScanner:
+    # route scoring split over worker processes: the route table and the bid/ask
+    # vectors live in shared memory, so a scan only ships shard bounds out and
+    # gets back the routes that clear the threshold
+    def __init__(self, workers=None, shards_per_worker=2):
+        self.workers = workers or os.cpu_count() or 1
+        self.shards = self.workers * shards_per_worker
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=mp.get_context('spawn'))
+        self.table = None
+        self.table_version = None
+        self.legs = None
+        self.prices = None
+
+    def _publish_table(self, table):
+        if self.legs is not None:
+            self.legs.close()
+        rows = table.legs[:len(table)]
+        self.legs = SharedArray(rows.shape, rows.dtype)
+        self.legs.array[:] = rows
+        self.table, self.table_version = table, table.version
+
+    def _publish_prices(self, bid, ask):
+        if self.prices is None or self.prices.array.shape[1] != len(bid):
+            if self.prices is not None:
+                self.prices.close()
+            self.prices = SharedArray((2, len(bid)), np.float64)
+        self.prices.array[0] = bid
+        self.prices.array[1] = ask
+
+    async def scan(self, table, bid, ask, threshold, top_k=None):
+        # awaited from the event loop; callers must not overlap scans, since the
+        # price block is rewritten in place (the hub scores under its lock)
+        if table is not self.table or table.version != self.table_version:
+            self._publish_table(table)
+        if not len(table):
+            return []
+        self._publish_prices(bid, ask)
+        bounds = np.linspace(0, len(table), min(self.shards, len(table)) + 1).astype(int)
+        loop = asyncio.get_running_loop()
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(self.pool, _scan_shard, self.legs.spec, self.prices.spec, int(a), int(b), threshold)
+            for a, b in zip(bounds[:-1], bounds[1:]) if b > a
+        ))
+        ids, gross, net, inv_gross, inv_net = (np.concatenate(cols) for cols in zip(*parts))
+        order = np.argsort(-np.fmax(net, inv_net), kind='stable')[:top_k]
+        return [route_entry(table, int(ids[j]), gross[j], net[j], inv_gross[j], inv_net[j]) for j in order]
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        for block in (self.legs, self.prices):
+            if block is not None:
+                block.close()
+        self.legs = self.prices = None
@@ -2,212 +2,263 @@
 import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 from urllib.parse import urlparse
 import aiomysql
+from user_cache import user_cache
 
 logger = logging.getLogger(__name__)
 
 # ====== إعدادات الاتصال بقاعدة البيانات - يتم جلبها من متغيرات البيئة تلقائياً ======
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_RECYCLE_SEC = int(os.getenv("DB_POOL_RECYCLE_SEC", 3600))
+DB_POOL_PING_SEC = float(os.getenv("DB_POOL_PING_SEC", 30))
 
-async def get_db_connection():
+_pool = None
+_pool_lock = asyncio.Lock()
+
+async def init_pool():
     """
-    تأسيس اتصال غير متزامن بقاعدة بيانات MySQL باستخدام DATABASE_URL.
+    إنشاء مجمع اتصالات مشترك (aiomysql pool) يُستخدم من جميع الدوال،
+    بدلاً من فتح اتصال TCP جديد والمصادقة مع كل استعلام.
     """
+    global _pool
     if not DATABASE_URL:
         logger.error("DATABASE_URL environment variable is not set.")
         return None
 
-    try:
-        url = urlparse(DATABASE_URL)
-        conn = await aiomysql.connect(
-            host=url.hostname,
-            user=url.username,
-            password=url.password,
-            db=url.path[1:],
-            port=url.port,
-            autocommit=True, # Ensure that the changes are committed instantly
-            loop=asyncio.get_event_loop()
-        )
-        return conn
-    except Exception as e:
-        logger.error(f"خطأ في الاتصال بقاعدة بيانات MySQL: {e}")
-        return None
+    async with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            return _pool
+        try:
+            url = urlparse(DATABASE_URL)
+            _pool = await aiomysql.create_pool(
+                host=url.hostname,
+                user=url.username,
+                password=url.password,
+                db=url.path[1:],
+                port=url.port or 3306,
+                minsize=DB_POOL_MIN,
+                maxsize=DB_POOL_MAX,
+                pool_recycle=DB_POOL_RECYCLE_SEC, # MySQL يغلق الاتصالات الخاملة بعد wait_timeout
+                autocommit=True, # Ensure that the changes are committed instantly
+            )
+            logger.info(f"تم إنشاء مجمع اتصالات MySQL ({DB_POOL_MIN}-{DB_POOL_MAX}).")
+            return _pool
+        except Exception as e:
+            logger.error(f"خطأ في الاتصال بقاعدة بيانات MySQL: {e}")
+            return None
 
-async def create_tables():
+async def close_pool():
     """
-    إنشاء الجداول الضرورية إذا لم تكن موجودة.
+    إغلاق مجمع الاتصالات بهدوء: ينتظر إعادة الاتصالات المستخدمة ثم يغلقها.
     """
-    conn = await get_db_connection()
-    if not conn:
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+        await pool.wait_closed()
+        logger.info("تم إغلاق مجمع اتصالات MySQL.")
+
+@asynccontextmanager
+async def acquire():
+    """
+    استعارة اتصال من المجمع (يُنشأ عند أول استخدام إذا لم يُهيأ مسبقاً).
+    الاتصال الخامل لأكثر من DB_POOL_PING_SEC يُفحص بـ ping قبل استخدامه، ويُعطى None عند الفشل.
+    """
+    pool = _pool if _pool is not None and not _pool.closed else await init_pool()
+    if pool is None:
+        yield None
         return
-    
-    async with conn.cursor() as cursor:
+    async with pool.acquire() as conn:
         try:
-            # جدول المستخدمين
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    api_key VARCHAR(255),
-                    api_secret VARCHAR(255),
-                    amount DECIMAL(10, 2)
-                )
-            """)
-            # جدول الصفقات
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS trades (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id BIGINT,
-                    pair VARCHAR(50),
-                    profit DECIMAL(10, 6),
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
-            await conn.commit()
-            logger.info("تم إنشاء الجداول بنجاح أو أنها موجودة بالفعل.")
+            if asyncio.get_running_loop().time() - conn.last_usage > DB_POOL_PING_SEC:
+                await conn.ping(reconnect=True)
         except Exception as e:
-            logger.error(f"خطأ في إنشاء الجداول: {e}")
-        finally:
-            conn.close()
+            logger.error(f"خطأ في الاتصال بقاعدة بيانات MySQL: {e}")
+            conn.close() # الاتصال المغلق لا يعود إلى المجمع
+            yield None
+            return
+        yield conn
+
+async def create_tables():
+    """
+    إنشاء الجداول الضرورية إذا لم تكن موجودة.
+    """
+    async with acquire() as conn:
+        if not conn:
+            return
+
+        async with conn.cursor() as cursor:
+            try:
+                # جدول المستخدمين
+                await cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        user_id BIGINT PRIMARY KEY,
+                        api_key VARCHAR(255),
+                        api_secret VARCHAR(255),
+                        amount DECIMAL(10, 2)
+                    )
+                """)
+                # جدول الصفقات
+                await cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS trades (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        user_id BIGINT,
+                        pair VARCHAR(50),
+                        profit DECIMAL(10, 6),
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users(user_id),
+                        INDEX idx_trades_user_timestamp (user_id, timestamp)
+                    )
+                """)
+                # الجداول القديمة أُنشئت بدون الفهرس المركب الذي يخدم get_last_trades
+                await cursor.execute(
+                    "SELECT 1 FROM information_schema.STATISTICS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'trades' AND INDEX_NAME = 'idx_trades_user_timestamp'"
+                )
+                if not await cursor.fetchone():
+                    await cursor.execute("CREATE INDEX idx_trades_user_timestamp ON trades (user_id, timestamp)")
+                await conn.commit()
+                logger.info("تم إنشاء الجداول بنجاح أو أنها موجودة بالفعل.")
+            except Exception as e:
+                logger.error(f"خطأ في إنشاء الجداول: {e}")
 
 async def create_user(user_id):
     """
     إضافة مستخدم جديد إلى قاعدة البيانات إذا لم يكن موجودًا.
     """
-    conn = await get_db_connection()
-    if not conn:
-        return
-    
-    async with conn.cursor() as cursor:
-        try:
-            await cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
-            if not await cursor.fetchone():
-                await cursor.execute("INSERT INTO users (user_id) VALUES (%s)", (user_id,))
-                await conn.commit()
-                logger.info(f"تم إنشاء المستخدم {user_id} في قاعدة البيانات.")
-            else:
-                logger.info(f"المستخدم {user_id} موجود بالفعل.")
-        except Exception as e:
-            logger.error(f"خطأ في إنشاء المستخدم: {e}")
-        finally:
-            conn.close()
+    async with acquire() as conn:
+        if not conn:
+            return
+
+        async with conn.cursor() as cursor:
+            try:
+                await cursor.execute("SELECT user_id FROM users WHERE user_id = %s", (user_id,))
+                if not await cursor.fetchone():
+                    await cursor.execute("INSERT INTO users (user_id) VALUES (%s)", (user_id,))
+                    await conn.commit()
+                    logger.info(f"تم إنشاء المستخدم {user_id} في قاعدة البيانات.")
+                else:
+                    logger.info(f"المستخدم {user_id} موجود بالفعل.")
+            except Exception as e:
+                logger.error(f"خطأ في إنشاء المستخدم: {e}")
 
 async def save_api_keys(user_id, api_key, api_secret):
     """
     حفظ مفاتيح API للمستخدم.
     """
-    conn = await get_db_connection()
-    if not conn:
-        return
-    
-    async with conn.cursor() as cursor:
-        try:
-            await cursor.execute(
-                "UPDATE users SET api_key = %s, api_secret = %s WHERE user_id = %s",
-                (api_key, api_secret, user_id)
-            )
-            await conn.commit()
-            logger.info(f"تم حفظ مفاتيح API للمستخدم {user_id}.")
-        except Exception as e:
-            logger.error(f"خطأ في حفظ مفاتيح API: {e}")
-        finally:
-            conn.close()
+    async with acquire() as conn:
+        if not conn:
+            return
+
+        async with conn.cursor() as cursor:
+            try:
+                await cursor.execute(
+                    "UPDATE users SET api_key = %s, api_secret = %s WHERE user_id = %s",
+                    (api_key, api_secret, user_id)
+                )
+                await conn.commit()
+                user_cache.invalidate(("api_keys", user_id))
+                logger.info(f"تم حفظ مفاتيح API للمستخدم {user_id}.")
+            except Exception as e:
+                logger.error(f"خطأ في حفظ مفاتيح API: {e}")
+
+async def _fetch_user_api_keys(user_id):
+    async with acquire() as conn:
+        if not conn:
+            raise ConnectionError("لا يوجد اتصال بقاعدة البيانات")
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("SELECT api_key, api_secret FROM users WHERE user_id = %s", (user_id,))
+            result = await cursor.fetchone()
+            return result if result else {}
 
 async def get_user_api_keys(user_id):
     """
-    استرجاع مفاتيح API للمستخدم.
+    استرجاع مفاتيح API للمستخدم (من الذاكرة المؤقتة إن وُجدت، وإلا من قاعدة البيانات).
     """
-    conn = await get_db_connection()
-    if not conn:
+    try:
+        return await user_cache.get_or_load(("api_keys", user_id), lambda: _fetch_user_api_keys(user_id))
+    except Exception as e:
+        logger.error(f"خطأ في استرجاع مفاتيح API: {e}")
         return {}
-    
-    async with conn.cursor(aiomysql.DictCursor) as cursor:
-        try:
-            await cursor.execute("SELECT api_key, api_secret FROM users WHERE user_id = %s", (user_id,))
-            result = await cursor.fetchone()
-            return result if result else {}
-        except Exception as e:
-            logger.error(f"خطأ في استرجاع مفاتيح API: {e}")
-            return {}
-        finally:
-            conn.close()
 
 async def save_amount(user_id, amount):
     """
     حفظ مبلغ التداول للمستخدم.
     """
-    conn = await get_db_connection()
-    if not conn:
-        return
-    
-    async with conn.cursor() as cursor:
-        try:
-            await cursor.execute("UPDATE users SET amount = %s WHERE user_id = %s", (amount, user_id))
-            await conn.commit()
-            logger.info(f"تم حفظ المبلغ {amount} للمستخدم {user_id}.")
-        except Exception as e:
-            logger.error(f"خطأ في حفظ المبلغ: {e}")
-        finally:
-            conn.close()
+    async with acquire() as conn:
+        if not conn:
+            return
+
+        async with conn.cursor() as cursor:
+            try:
+                await cursor.execute("UPDATE users SET amount = %s WHERE user_id = %s", (amount, user_id))
+                await conn.commit()
+                user_cache.invalidate(("amount", user_id))
+                logger.info(f"تم حفظ المبلغ {amount} للمستخدم {user_id}.")
+            except Exception as e:
+                logger.error(f"خطأ في حفظ المبلغ: {e}")
+
+async def _fetch_amount(user_id):
+    async with acquire() as conn:
+        if not conn:
+            raise ConnectionError("لا يوجد اتصال بقاعدة البيانات")
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT amount FROM users WHERE user_id = %s", (user_id,))
+            result = await cursor.fetchone()
+            return result[0] if result and result[0] else 0.0
 
 async def get_amount(user_id):
     """
-    استرجاع مبلغ التداول للمستخدم.
+    استرجاع مبلغ التداول للمستخدم (من الذاكرة المؤقتة إن وُجد، وإلا من قاعدة البيانات).
     """
-    conn = await get_db_connection()
-    if not conn:
+    try:
+        return await user_cache.get_or_load(("amount", user_id), lambda: _fetch_amount(user_id))
+    except Exception as e:
+        logger.error(f"خطأ في استرجاع المبلغ: {e}")
         return 0.0
-    
-    async with conn.cursor() as cursor:
-        try:
-            await cursor.execute("SELECT amount FROM users WHERE user_id = %s", (user_id,))
-            result = await cursor.fetchone()
-            return result[0] if result and result[0] else 0.0
-        except Exception as e:
-            logger.error(f"خطأ في استرجاع المبلغ: {e}")
-            return 0.0
-        finally:
-            conn.close()
 
 async def save_last_trades(user_id, pair, profit):
     """
     حفظ تفاصيل آخر صفقة للمستخدم.
     """
-    conn = await get_db_connection()
-    if not conn:
-        return
-    
-    async with conn.cursor() as cursor:
-        try:
-            await cursor.execute(
-                "INSERT INTO trades (user_id, pair, profit) VALUES (%s, %s, %s)",
-                (user_id, pair, profit)
-            )
-            await conn.commit()
-            logger.info(f"تم حفظ الصفقة للمستخدم {user_id}.")
-        except Exception as e:
-            logger.error(f"خطأ في حفظ الصفقة: {e}")
-        finally:
-            conn.close()
+    async with acquire() as conn:
+        if not conn:
+            return
+
+        async with conn.cursor() as cursor:
+            try:
+                await cursor.execute(
+                    "INSERT INTO trades (user_id, pair, profit) VALUES (%s, %s, %s)",
+                    (user_id, pair, profit)
+                )
+                await conn.commit()
+                logger.info(f"تم حفظ الصفقة للمستخدم {user_id}.")
+            except Exception as e:
+                logger.error(f"خطأ في حفظ الصفقة: {e}")
 
 async def get_last_trades(user_id):
     """
     استرجاع آخر الصفقات المسجلة للمستخدم.
     """
-    conn = await get_db_connection()
-    if not conn:
-        return []
-    
-    async with conn.cursor(aiomysql.DictCursor) as cursor:
-        try:
-            await cursor.execute("SELECT pair, profit, timestamp FROM trades WHERE user_id = %s ORDER BY timestamp DESC LIMIT 10", (user_id,))
-            return await cursor.fetchall()
-        except Exception as e:
-            logger.error(f"خطأ في استرجاع الصفقات: {e}")
+    async with acquire() as conn:
+        if not conn:
             return []
-        finally:
-            conn.close()
+
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            try:
+                await cursor.execute("SELECT pair, profit, timestamp FROM trades WHERE user_id = %s ORDER BY timestamp DESC LIMIT 10", (user_id,))
+                return await cursor.fetchall()
+            except Exception as e:
+                logger.error(f"خطأ في استرجاع الصفقات: {e}")
+                return []
+
+async def _main():
+    await create_tables()
+    await close_pool()
 
 if __name__ == "__main__":
-    asyncio.run(create_tables())
\ No newline at end of file
+    asyncio.run(_main())
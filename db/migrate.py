@@ -0,0 +1,25 @@
+import logging
+import os
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+from db.session import engine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+BASELINE = "0001_baseline"
+
+def _upgrade(conn):
+    cfg = Config(ALEMBIC_INI)
+    cfg.attributes['connection'] = conn
+    tables = inspect(conn).get_table_names()
+    if "alembic_version" not in tables and "users" in tables:
+        # schema came from create_all before migrations existed
+        logger.info(f"stamping existing schema as {BASELINE}")
+        command.stamp(cfg, BASELINE)
+    command.upgrade(cfg, "head")
+
+async def upgrade_head():
+    async with engine.begin() as conn:
+        await conn.run_sync(_upgrade)
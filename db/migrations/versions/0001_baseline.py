@@ -0,0 +1,86 @@
+"""baseline schema, as created by Base.metadata.create_all
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('username', sa.String(128), unique=True, nullable=False),
+        sa.Column('telegram_chat_id', sa.String(64), nullable=True),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+    )
+    op.create_table(
+        'api_keys',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('exchange', sa.String(32), nullable=False),
+        sa.Column('api_key', sa.Text, nullable=False),
+        sa.Column('api_secret', sa.Text, nullable=False),
+        sa.Column('can_withdraw', sa.Boolean, nullable=False),
+        sa.Column('is_active', sa.Boolean, nullable=False),
+    )
+    op.create_table(
+        'account_settings',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('trading_amount_usdt', sa.Float, nullable=False),
+        sa.Column('is_running', sa.Boolean, nullable=False),
+        sa.Column('bnb_reserve', sa.Float, nullable=False),
+        sa.Column('accumulated_profit', sa.Float, nullable=False),
+        sa.Column('last_compound_at', sa.DateTime, nullable=True),
+    )
+    op.create_table(
+        'opportunities',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, nullable=True),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.Column('length', sa.Integer, nullable=False),
+        sa.Column('route', sa.String(512), nullable=False),
+        sa.Column('expected_gross_pct', sa.Float, nullable=False),
+        sa.Column('expected_net_pct', sa.Float, nullable=False),
+        sa.Column('reason', sa.String(255), nullable=True),
+        sa.Column('viable', sa.Boolean, nullable=False),
+    )
+    op.create_table(
+        'trades',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, nullable=False),
+        sa.Column('started_at', sa.DateTime, nullable=False),
+        sa.Column('finished_at', sa.DateTime, nullable=True),
+        sa.Column('route', sa.String(512), nullable=False),
+        sa.Column('length', sa.Integer, nullable=False),
+        sa.Column('notional_usdt', sa.Float, nullable=False),
+        sa.Column('gross_pct', sa.Float, nullable=True),
+        sa.Column('net_pct', sa.Float, nullable=True),
+        sa.Column('status', sa.String(32), nullable=False),
+        sa.Column('details', sa.JSON, nullable=True),
+    )
+    op.create_table(
+        'fee_ledger',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, nullable=False),
+        sa.Column('ts', sa.DateTime, nullable=False),
+        sa.Column('profit_usdt', sa.Float, nullable=False),
+        sa.Column('fee_pct', sa.Float, nullable=False),
+        sa.Column('fee_usdt', sa.Float, nullable=False),
+        sa.Column('settled', sa.Boolean, nullable=False),
+        sa.Column('tx_ref', sa.String(128), nullable=True),
+    )
+
+
+def downgrade():
+    for table in ('fee_ledger', 'trades', 'opportunities', 'account_settings', 'api_keys', 'users'):
+        op.drop_table(table)
@@ -0,0 +1,68 @@
+"""inventory settings, opportunity rollups, (id, created_at) key on opportunities
+
+Revision ID: 0002_inventory_rollups
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002_inventory_rollups'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+# databases that ran the app before migrations existed got some of these changes from
+# create_all already (it creates missing tables, never alters existing ones); every step checks first
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _has_column(table, column):
+    return column in {c['name'] for c in _inspector().get_columns(table)}
+
+
+def _primary_key(table):
+    return _inspector().get_pk_constraint(table)['constrained_columns']
+
+
+def _partitioned():
+    q = op.get_bind().execute(sa.text(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'opportunities' AND PARTITION_NAME IS NOT NULL"
+    ))
+    return q.scalar() > 0
+
+
+def upgrade():
+    if not _has_column('account_settings', 'inventory_mode'):
+        op.add_column('account_settings', sa.Column('inventory_mode', sa.Boolean, nullable=False, server_default=sa.false()))
+    if not _has_column('account_settings', 'inventory_targets'):
+        op.add_column('account_settings', sa.Column('inventory_targets', sa.JSON, nullable=True))
+    if not _inspector().has_table('opportunity_rollups'):
+        op.create_table(
+            'opportunity_rollups',
+            sa.Column('minute', sa.DateTime, primary_key=True),
+            sa.Column('route', sa.String(512), primary_key=True),
+            sa.Column('length', sa.Integer, nullable=False),
+            sa.Column('samples', sa.Integer, nullable=False),
+            sa.Column('viable', sa.Integer, nullable=False),
+            sa.Column('sum_net_pct', sa.Float, nullable=False),
+            sa.Column('min_net_pct', sa.Float, nullable=False),
+            sa.Column('max_net_pct', sa.Float, nullable=False),
+        )
+    # core.retention may already have rebuilt the key when it partitioned the table
+    if _primary_key('opportunities') == ['id']:
+        op.execute("ALTER TABLE opportunities DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)")
+
+
+def downgrade():
+    if _primary_key('opportunities') == ['id', 'created_at']:
+        if _partitioned():
+            op.execute("ALTER TABLE opportunities REMOVE PARTITIONING")
+        op.execute("ALTER TABLE opportunities DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+    op.drop_table('opportunity_rollups')
+    op.drop_column('account_settings', 'inventory_targets')
+    op.drop_column('account_settings', 'inventory_mode')
@@ -0,0 +1,40 @@
+"""secondary indexes for the per-user lookups
+
+Revision ID: 0003_query_indexes
+Revises: 0002_inventory_rollups
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003_query_indexes'
+down_revision = '0002_inventory_rollups'
+branch_labels = None
+depends_on = None
+
+# InnoDB already backs the api_keys/account_settings foreign keys with an index on user_id;
+# naming them here only makes the index explicit, MySQL drops its implicit one when these appear.
+INDEXES = [
+    ('ix_users_telegram_chat_id', 'users', ['telegram_chat_id']),
+    ('ix_api_keys_user_id', 'api_keys', ['user_id']),
+    ('ix_account_settings_user_id', 'account_settings', ['user_id']),
+    ('ix_trades_user_id_started_at', 'trades', ['user_id', 'started_at']),
+    ('ix_opportunities_user_id_created_at', 'opportunities', ['user_id', 'created_at']),
+    ('ix_fee_ledger_user_id_ts', 'fee_ledger', ['user_id', 'ts']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        if name not in {ix['name'] for ix in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    # the foreign keys need an index on user_id; MySQL refuses to drop the last one
+    for name, table, columns in reversed(INDEXES):
+        if table in ('api_keys', 'account_settings'):
+            continue
+        op.drop_index(name, table_name=table)
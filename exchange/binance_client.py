@@ -1,5 +1,18 @@
 import ccxt
 from config import settings
+from exchange.markets_cache import get_markets_cache
+
+def _exchange(opts):
+    x = ccxt.binance(opts)
+    if settings.binance_testnet:
+        try:
+            x.set_sandbox_mode(True)
+        except Exception:
+            pass
+    return x
+
+def download_markets():
+    return _exchange({'enableRateLimit': True, 'options': {'defaultType': 'spot'}}).load_markets()
 
 class BinanceClient:
     def __init__(self, api_key: str | None = None, api_secret: str | None = None):
@@ -9,15 +22,18 @@ class BinanceClient:
             # ccxt requires at least empty strings to instantiate proper exchange object
             opts['apiKey'] = ''
             opts['secret'] = ''
-        self.x = ccxt.binance(opts)
-        if settings.binance_testnet:
-            try:
-                self.x.set_sandbox_mode(True)
-            except Exception:
-                pass
+        self.x = _exchange(opts)
 
     def load_markets(self):
-        return self.x.load_markets()
+        if not settings.markets_cache_path:
+            return self.x.load_markets()
+        markets = get_markets_cache(download_markets).get()
+        if markets is not self.x.markets:
+            self.x.set_markets(markets)
+        return markets
+
+    def set_markets(self, markets):
+        self.x.set_markets(markets)
 
     def fetch_order_book(self, symbol: str, limit: int = 10):
         return self.x.fetch_order_book(symbol, limit=limit)
@@ -25,9 +41,25 @@ class BinanceClient:
     def fetch_ticker(self, symbol: str):
         return self.x.fetch_ticker(symbol)
 
+    def fetch_bids_asks(self, symbols=None):
+        return self.x.fetch_bids_asks(symbols)
+
+    def fetch_tickers(self, symbols=None):
+        return self.x.fetch_tickers(symbols)
+
     def fetch_balance(self):
         return self.x.fetch_balance()
 
+    def fetch_account(self):
+        # raw /api/v3/account ({'balances': [...], 'updateTime': ...}) for the user-data balance cache
+        return self.x.privateGetAccount()
+
+    def create_listen_key(self):
+        return self.x.publicPostUserDataStream()['listenKey']
+
+    def keepalive_listen_key(self, listen_key: str):
+        return self.x.publicPutUserDataStream({'listenKey': listen_key})
+
     def create_market_order(self, symbol: str, side: str, amount: float):
         if not settings.live_mode:
             price = self.fetch_ticker(symbol)['last']
@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+import threading
+import time
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class MarketsCache:
+    # ccxt markets persisted to disk: fresh copies are served from memory,
+    # stale ones are served immediately while a background thread re-downloads
+    def __init__(self, path, ttl, fetch_fn):
+        self.path = path
+        self.ttl = ttl
+        self.fetch_fn = fetch_fn
+        self.markets = None
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _age(self):
+        return time.time() - self.fetched_at
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.markets, self.fetched_at = data['markets'], data['fetched_at']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _write(self, markets, fetched_at):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'fetched_at': fetched_at, 'markets': markets}, f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+
+    def refresh(self):
+        markets = self.fetch_fn()
+        fetched_at = time.time()
+        try:
+            self._write(markets, fetched_at)
+        except OSError as e:
+            logger.warning(f"markets cache write failed: {e}")
+        self.markets, self.fetched_at = markets, fetched_at
+        return markets
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"markets cache refresh failed: {e}")
+        finally:
+            self._refreshing = False
+
+    def get(self):
+        with self._lock:
+            if self.markets is None:
+                self._read()
+            if self.markets is None:
+                return self.refresh()
+            if self._age() >= self.ttl and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            return self.markets
+
+_caches = {}
+
+def get_markets_cache(fetch_fn, path=None, ttl=None):
+    path = path or settings.markets_cache_path
+    if path not in _caches:
+        _caches[path] = MarketsCache(path, ttl or settings.markets_cache_ttl_sec, fetch_fn)
+    return _caches[path]
+
+def cached_markets():
+    from exchange.binance_client import download_markets
+    if not settings.markets_cache_path:
+        return download_markets()
+    return get_markets_cache(download_markets).get()
@@ -0,0 +1,258 @@
+# replay.py
+# Local WebSocket stand-in for the Binance combined and user-data streams, used to
+# test MarketStream / BalanceCache ingestion and recovery offline:
+#   python -m exchange.replay --bench --symbols 50 --events 200000 --gap-every 5000
+#   python -m exchange.replay --bench-user --assets 20 --events 50000 --close-after 10000
+#   python -m exchange.replay --file recorded.jsonl --port 8765
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import websockets
+
+logger = logging.getLogger(__name__)
+
+class SyntheticFeed:
+    def __init__(self, symbol_ids, levels=50, seed=0, gap_every=0):
+        self.rng = random.Random(seed)
+        self.levels = levels
+        self.gap_every = gap_every
+        self.count = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.books = {}
+        for sid in symbol_ids:
+            mid = self.rng.uniform(0.01, 1000)
+            self.books[sid] = {
+                'mid': mid,
+                'bids': {round(mid * (1 - 0.001 * k), 8): round(self.rng.uniform(0.1, 10), 4) for k in range(1, levels + 1)},
+                'asks': {round(mid * (1 + 0.001 * k), 8): round(self.rng.uniform(0.1, 10), 4) for k in range(1, levels + 1)},
+                'u': 1000,
+            }
+
+    def next_events(self):
+        with self.lock:
+            sid = self.rng.choice(list(self.books))
+            book = self.books[sid]
+            changes = {'b': [], 'a': []}
+            for _ in range(self.rng.randint(1, 3)):
+                key = self.rng.choice(('b', 'a'))
+                side = book['bids' if key == 'b' else 'asks']
+                k = self.rng.randint(1, self.levels)
+                p = round(book['mid'] * (1 - 0.001 * k if key == 'b' else 1 + 0.001 * k), 8)
+                q = 0.0 if self.rng.random() < 0.2 else round(self.rng.uniform(0.1, 10), 4)
+                if q:
+                    side[p] = q
+                else:
+                    side.pop(p, None)
+                changes[key].append([str(p), str(q)])
+            first = book['u'] + 1
+            book['u'] += self.rng.randint(1, 3)
+            self.count += 1
+            if self.gap_every and self.count % self.gap_every == 0:
+                self.dropped += 1
+                return []
+            bid, ask = max(book['bids']), min(book['asks'])
+            return [
+                {'stream': f"{sid.lower()}@depth@100ms", 'data': {'e': 'depthUpdate', 'E': int(time.time() * 1000), 's': sid, 'U': first, 'u': book['u'], 'b': changes['b'], 'a': changes['a']}},
+                {'stream': f"{sid.lower()}@bookTicker", 'data': {'u': book['u'], 's': sid, 'b': str(bid), 'B': str(book['bids'][bid]), 'a': str(ask), 'A': str(book['asks'][ask])}},
+            ]
+
+    def snapshot(self, sid, limit=None):
+        with self.lock:
+            book = self.books[sid]
+            return {
+                'lastUpdateId': book['u'],
+                'bids': [[str(p), str(q)] for p, q in sorted(book['bids'].items(), reverse=True)[:limit]],
+                'asks': [[str(p), str(q)] for p, q in sorted(book['asks'].items())[:limit]],
+            }
+
+class SyntheticAccount:
+    # random fills on one account, emitted as executionReport + outboundAccountPosition
+    def __init__(self, assets=20, seed=0):
+        self.rng = random.Random(seed)
+        self.assets = ['USDT'] + [f"A{i}" for i in range(assets - 1)]
+        self.balances = {a: round(self.rng.uniform(10, 1000), 8) for a in self.assets}
+        self.clock = int(time.time() * 1000)
+        self.order_id = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def next_events(self):
+        with self.lock:
+            spend, receive = self.rng.sample(self.assets, 2)
+            qty = round(self.balances[spend] * self.rng.uniform(0.01, 0.2), 8)
+            got = round(qty * self.rng.uniform(0.5, 2), 8)
+            self.balances[spend] = round(self.balances[spend] - qty, 8)
+            self.balances[receive] = round(self.balances[receive] + got, 8)
+            self.clock += 1
+            self.order_id += 1
+            self.count += 1
+            symbol = f"{receive}{spend}"
+            return [
+                {'e': 'executionReport', 'E': self.clock, 's': symbol, 'S': 'BUY', 'o': 'MARKET', 'i': self.order_id,
+                 'X': 'FILLED', 'x': 'TRADE', 'z': str(got), 'Z': str(qty), 'T': self.clock},
+                {'e': 'outboundAccountPosition', 'E': self.clock, 'u': self.clock,
+                 'B': [{'a': a, 'f': str(self.balances[a]), 'l': '0.00000000'} for a in (spend, receive)]},
+            ]
+
+    def account(self):
+        with self.lock:
+            return {'updateTime': self.clock, 'balances': [{'asset': a, 'free': str(f), 'locked': '0.00000000'} for a, f in self.balances.items()]}
+
+class ReplayServer:
+    def __init__(self, messages=None, feed=None, events=0, host='127.0.0.1', port=0, close_after=0, lost_on_close=5):
+        self.messages = messages or []
+        self.feed = feed
+        self.events = events
+        self.remaining = events
+        self.host = host
+        self.port = port
+        # drop the connection every close_after events, losing lost_on_close events while "offline"
+        self.close_after = close_after
+        self.lost_on_close = lost_on_close
+        self.sent = 0
+        self.closes = 0
+        self.server = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/stream"
+
+    async def handler(self, ws, *args):
+        for msg in self.messages:
+            await ws.send(json.dumps(msg))
+            self.sent += 1
+        i = 0
+        while self.remaining > 0:
+            for msg in self.feed.next_events():
+                await ws.send(json.dumps(msg))
+                self.sent += 1
+            self.remaining -= 1
+            i += 1
+            if self.close_after and i >= self.close_after and self.remaining > 0:
+                for _ in range(self.lost_on_close):
+                    self.feed.next_events()
+                self.closes += 1
+                await ws.close()
+                return
+            if i % 1000 == 0:
+                await asyncio.sleep(0)
+        await ws.wait_closed()
+
+    async def start(self):
+        self.server = await websockets.serve(self.handler, self.host, self.port, max_size=None)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+async def bench(symbols=50, events=200000, gap_every=5000):
+    from exchange.stream import MarketStream
+    sids = [f"SYM{i}USDT" for i in range(symbols)]
+    feed = SyntheticFeed(sids, gap_every=gap_every)
+    server = await ReplayServer(feed=feed, events=events).start()
+    stream = MarketStream({sid: sid for sid in sids}, feed.snapshot, url=server.url)
+    started = time.perf_counter()
+    task = asyncio.create_task(stream.run())
+    while feed.count < events or stream.messages < server.sent:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.5)
+    task.cancel()
+    await server.stop()
+    matched = mismatched = behind = 0
+    for sid in sids:
+        book, truth = stream.books[sid], feed.books[sid]
+        if book.last_update_id != truth['u']:
+            behind += 1
+        elif book.bids == truth['bids'] and book.asks == truth['asks']:
+            matched += 1
+        else:
+            mismatched += 1
+    return {
+        'messages': stream.messages,
+        'seconds': round(elapsed, 3),
+        'msgs_per_sec': round(stream.messages / elapsed),
+        'gaps_injected': feed.dropped,
+        'resyncs': stream.resyncs,
+        'books_matched': matched,
+        'books_mismatched': mismatched,
+        'books_behind': behind,
+    }
+
+async def bench_user(assets=20, events=50000, close_after=10000):
+    from exchange.user_stream import BalanceCache
+    feed = SyntheticAccount(assets)
+    server = await ReplayServer(feed=feed, events=events, close_after=close_after).start()
+
+    async def load():
+        return feed.account()
+
+    async def listen_key():
+        return 'local'
+
+    async def keepalive(key):
+        return None
+
+    cache = BalanceCache(load, listen_key, keepalive, url=server.url)
+    started = time.perf_counter()
+    task = cache.start()
+    while server.remaining > 0 or cache.events < server.sent or not cache.synced:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    reads = 100000
+    t0 = time.perf_counter()
+    for _ in range(reads):
+        cache.balance('USDT')
+    read_ns = (time.perf_counter() - t0) / reads * 1e9
+    task.cancel()
+    await server.stop()
+    mismatched = [a for a, f in feed.balances.items() if abs(cache.free.get(a, 0.0) - f) > 1e-9]
+    return {
+        'events': cache.events,
+        'seconds': round(elapsed, 3),
+        'events_per_sec': round(cache.events / elapsed),
+        'disconnects': server.closes,
+        'rest_loads': cache.resyncs,
+        'balance_read_ns': round(read_ns),
+        'assets_mismatched': len(mismatched),
+    }
+
+async def serve_file(path, host, port):
+    with open(path) as f:
+        messages = [json.loads(line) for line in f if line.strip()]
+    server = await ReplayServer(messages=messages, host=host, port=port).start()
+    logger.info(f"replaying {len(messages)} messages on {server.url}")
+    await asyncio.Future()
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--file')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8765)
+    ap.add_argument('--bench', action='store_true')
+    ap.add_argument('--symbols', type=int, default=50)
+    ap.add_argument('--events', type=int, default=200000)
+    ap.add_argument('--gap-every', type=int, default=5000)
+    ap.add_argument('--bench-user', action='store_true')
+    ap.add_argument('--assets', type=int, default=20)
+    ap.add_argument('--close-after', type=int, default=10000)
+    args = ap.parse_args()
+    if args.bench:
+        print(asyncio.run(bench(args.symbols, args.events, args.gap_every)))
+    elif args.bench_user:
+        print(asyncio.run(bench_user(args.assets, args.events, args.close_after)))
+    elif args.file:
+        asyncio.run(serve_file(args.file, args.host, args.port))
+    else:
+        ap.error('pass --bench, --bench-user or --file')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import asyncio
+import ccxt
+import heapq
+import json
+import logging
+import time
+import numpy as np
+import websockets
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+STREAM_URL = "wss://stream.binance.com:9443/stream"
+TESTNET_STREAM_URL = "wss://testnet.binance.vision/stream"
+MAX_STREAMS_PER_CONNECTION = 1000
+# diff events kept per unsynced book while its snapshot is pending; older ones are dropped,
+# the snapshot that ends the wait is newer than them anyway
+MAX_BUFFERED_EVENTS = 1000
+# /api/v3/depth costs 5 weight up to 100 levels and 50 at 1000; diffs keep a 100-level
+# book current and sizing reads DEPTH_LEVELS (20 by default) of it
+SNAPSHOT_LIMIT = 100
+
+def depth_weight(limit):
+    return 5 if limit <= 100 else 25 if limit <= 500 else 50 if limit <= 1000 else 250
+
+class WeightLimiter:
+    # token bucket over REST request weight, so a reconnect resyncing hundreds of books
+    # spreads its snapshots over time instead of tripping the per-minute IP limit (429, then 418)
+    def __init__(self, per_minute, burst_sec=10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = self.rate * burst_sec
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, weight):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep((weight - self.tokens) / self.rate)
+
+class LocalOrderBook:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = {}
+        self.asks = {}
+        self.last_update_id = None
+        self.fresh_snapshot = False
+        self.buffer = []
+        self._top = None
+
+    @property
+    def synced(self):
+        return self.last_update_id is not None
+
+    def reset(self):
+        self.last_update_id = None
+        self.buffer = []
+        self._top = None
+
+    def load_snapshot(self, snapshot):
+        self.bids = {float(p): float(q) for p, q, *_ in snapshot['bids']}
+        self.asks = {float(p): float(q) for p, q, *_ in snapshot['asks']}
+        self.last_update_id = int(snapshot.get('lastUpdateId') or snapshot['nonce'])
+        self.fresh_snapshot = True
+        self._top = None
+        buffered, self.buffer = self.buffer, []
+        for event in buffered:
+            if not self.apply(event):
+                return False
+        return True
+
+    def apply(self, event):
+        # returns False when a gap in update ids means the book must be resynced
+        if not self.synced:
+            self.buffer.append(event)
+            if len(self.buffer) > MAX_BUFFERED_EVENTS:
+                del self.buffer[:-MAX_BUFFERED_EVENTS]
+            return True
+        first, last = event['U'], event['u']
+        if last <= self.last_update_id:
+            return True
+        if self.fresh_snapshot:
+            if not first <= self.last_update_id + 1 <= last:
+                self.reset()
+                return False
+        elif first != self.last_update_id + 1:
+            self.reset()
+            return False
+        for side, levels in ((self.bids, event['b']), (self.asks, event['a'])):
+            for p, q in levels:
+                p, q = float(p), float(q)
+                if q == 0:
+                    side.pop(p, None)
+                else:
+                    side[p] = q
+        self.last_update_id = last
+        self.fresh_snapshot = False
+        self._top = None
+        return True
+
+    def top(self, limit=20):
+        if self._top is None or self._top[0] < limit:
+            bids = [[p, self.bids[p]] for p in heapq.nlargest(limit, self.bids)]
+            asks = [[p, self.asks[p]] for p in heapq.nsmallest(limit, self.asks)]
+            self._top = (limit, bids, asks)
+        _, bids, asks = self._top
+        return {'symbol': self.symbol, 'bids': bids[:limit], 'asks': asks[:limit], 'nonce': self.last_update_id}
+
+class _Connection:
+    # one combined-stream socket: `names` is what it should carry, `subscribed` what the open socket does
+    def __init__(self, names):
+        self.names = set(names)
+        self.subscribed = set()
+        self.ws = None
+        self.task = None
+
+class MarketStream:
+    def __init__(self, symbol_ids, snapshot_fn, url=None, depth_speed='100ms', max_age=5.0,
+                 snapshot_limit=SNAPSHOT_LIMIT, limiter=None):
+        # symbol_ids: exchange id (e.g. BTCUSDT) -> unified symbol (e.g. BTC/USDT);
+        # snapshot_fn(symbol, limit) is a blocking REST depth call
+        self.symbols = dict(symbol_ids)
+        self.snapshot_fn = snapshot_fn
+        self.snapshot_limit = snapshot_limit
+        self.limiter = limiter or WeightLimiter(settings.snapshot_weight_per_min)
+        self.url = url or (TESTNET_STREAM_URL if settings.binance_testnet else STREAM_URL)
+        self.depth_speed = depth_speed
+        self.max_age = max_age
+        self.books = {s: LocalOrderBook(s) for s in self.symbols.values()}
+        self.tickers = {}
+        self.messages = 0
+        self.resyncs = 0
+        self._resyncing = {}  # symbol -> resync task
+        self._conns = [_Connection(names) for names in self._streams()]
+        self._running = False
+        self._request_id = 0
+
+    @classmethod
+    def for_markets(cls, markets, snapshot_fn, symbols=None, **kw):
+        symbols = symbols or [s for s, m in markets.items() if m.get('active', True)]
+        return cls({markets[s]['id']: s for s in symbols}, snapshot_fn, **kw)
+
+    def _names(self, sid):
+        return {f"{sid.lower()}@bookTicker", f"{sid.lower()}@depth@{self.depth_speed}"}
+
+    def _streams(self):
+        names = [n for sid in self.symbols for n in sorted(self._names(sid))]
+        return [names[i:i + MAX_STREAMS_PER_CONNECTION] for i in range(0, len(names), MAX_STREAMS_PER_CONNECTION)]
+
+    async def run(self):
+        self._running = True
+        for conn in self._conns:
+            conn.task = asyncio.create_task(self._connection(conn))
+        try:
+            await asyncio.Future()
+        finally:
+            self._running = False
+            for t in [c.task for c in self._conns if c.task] + list(self._resyncing.values()):
+                t.cancel()
+            for conn in self._conns:
+                conn.task = None
+
+    async def _connection(self, conn):
+        backoff = 1
+        while True:
+            try:
+                names = sorted(conn.names)
+                async with websockets.connect(f"{self.url}?streams={'/'.join(names)}", max_size=None) as ws:
+                    backoff = 1
+                    conn.ws, conn.subscribed = ws, set(names)
+                    for n in names:
+                        symbol = self.symbols.get(n.split('@')[0].upper())
+                        if symbol is not None and symbol in self.books:
+                            self.books[symbol].reset()
+                            self._schedule_resync(symbol)
+                    # the symbol set may have changed while connecting
+                    await self._sync(conn)
+                    async for raw in ws:
+                        self.on_message(json.loads(raw))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"market stream reconnect in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                conn.ws = None
+
+    async def _sync(self, conn):
+        # brings the open socket in line with conn.names; at most two requests, well under
+        # Binance's 5 incoming messages per second per connection
+        ws = conn.ws
+        if ws is None:
+            return
+        for method, names in (("UNSUBSCRIBE", conn.subscribed - conn.names), ("SUBSCRIBE", conn.names - conn.subscribed)):
+            if names:
+                self._request_id += 1
+                await ws.send(json.dumps({"method": method, "params": sorted(names), "id": self._request_id}))
+        conn.subscribed = set(conn.names)
+
+    async def update_symbols(self, symbol_ids):
+        # follows a changed symbol set in place: symbols that stay keep their sockets and
+        # books, removed ones are unsubscribed and dropped, added ones are subscribed on a
+        # connection with room and snapshotted once their first diff arrives
+        symbol_ids = dict(symbol_ids)
+        removed = [sid for sid in self.symbols if sid not in symbol_ids]
+        added = [sid for sid in symbol_ids if sid not in self.symbols]
+        if not (removed or added):
+            return
+        touched = []
+        for sid in removed:
+            symbol = self.symbols.pop(sid)
+            self.books.pop(symbol, None)
+            self.tickers.pop(symbol, None)
+            task = self._resyncing.pop(symbol, None)
+            if task is not None:
+                task.cancel()
+            names = self._names(sid)
+            for conn in self._conns:
+                if conn.names & names:
+                    conn.names -= names
+                    touched.append(conn)
+        for sid in added:
+            symbol = symbol_ids[sid]
+            self.symbols[sid] = symbol
+            self.books[symbol] = LocalOrderBook(symbol)
+            names = self._names(sid)
+            conn = next((c for c in self._conns if len(c.names) + len(names) <= MAX_STREAMS_PER_CONNECTION), None)
+            if conn is None:
+                conn = _Connection(())
+                self._conns.append(conn)
+            conn.names |= names
+            touched.append(conn)
+        for conn in dict.fromkeys(touched):
+            if not conn.names:
+                if conn.task is not None:
+                    conn.task.cancel()
+                self._conns.remove(conn)
+            elif self._running and conn.task is None:
+                conn.task = asyncio.create_task(self._connection(conn))
+            else:
+                try:
+                    await self._sync(conn)
+                except Exception as e:
+                    # the reconnect that follows subscribes from conn.names
+                    logger.warning(f"market stream resubscribe failed: {e}")
+        logger.info(f"market stream symbols: -{len(removed)} +{len(added)} -> {len(self.symbols)} "
+                    f"on {len(self._conns)} connections")
+
+    def on_message(self, msg):
+        self.messages += 1
+        data = msg.get('data', msg)
+        symbol = self.symbols.get(data.get('s'))
+        if symbol is None:
+            return
+        if data.get('e') == 'depthUpdate':
+            book = self.books[symbol]
+            if not book.apply(data):
+                self.resyncs += 1
+                book.apply(data)  # the book was reset, so this buffers the event
+            if not book.synced:
+                # covers gaps, reconnects and a resync that gave up; no-op while one is running
+                self._schedule_resync(symbol)
+        else:
+            self.tickers[symbol] = (float(data['b']), float(data['a']), time.monotonic())
+
+    def _schedule_resync(self, symbol):
+        if symbol in self._resyncing:
+            return
+        self._resyncing[symbol] = asyncio.get_running_loop().create_task(self._resync(symbol))
+
+    async def _resync(self, symbol):
+        book = self.books[symbol]
+        backoff = 1
+        try:
+            while True:
+                await self.limiter.acquire(depth_weight(self.snapshot_limit))
+                try:
+                    snapshot = await asyncio.to_thread(self.snapshot_fn, symbol, self.snapshot_limit)
+                except Exception as e:
+                    # the book stays unsynced and buffering until a snapshot arrives
+                    if isinstance(e, ccxt.DDoSProtection):
+                        # 429/418 apply to the whole IP: hold every snapshot, not just this one
+                        self.limiter.pause(60)
+                    logger.warning(f"order book snapshot failed for {symbol}, retry in {backoff}s: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+                if book.load_snapshot(snapshot):
+                    return
+                self.resyncs += 1
+                # events are buffered while unsynced; retry once newer ones have arrived
+                await asyncio.sleep(0.1)
+        finally:
+            if self._resyncing.get(symbol) is asyncio.current_task():
+                del self._resyncing[symbol]
+
+    def bid_ask(self, symbol):
+        t = self.tickers.get(symbol)
+        if t and time.monotonic() - t[2] < self.max_age:
+            return t[0], t[1]
+        book = self.books.get(symbol)
+        if book and book.synced and book.bids and book.asks:
+            top = book.top(1)
+            return top['bids'][0][0], top['asks'][0][0]
+        return None, None
+
+    def covers(self, symbol):
+        return symbol in self.books
+
+    def best_price(self, symbol, is_buy):
+        bid, ask = self.bid_ask(symbol)
+        return ask if is_buy else bid
+
+    def vectors(self, symbols):
+        bid = np.full(len(symbols), np.nan)
+        ask = np.full(len(symbols), np.nan)
+        for i, s in enumerate(symbols):
+            b, a = self.bid_ask(s)
+            bid[i] = b or np.nan
+            ask[i] = a or np.nan
+        return bid, ask
+
+    def order_book(self, symbol, limit=20):
+        book = self.books.get(symbol)
+        if not book or not book.synced:
+            return None
+        return book.top(limit)
@@ -0,0 +1,93 @@
+# symbol_filters.py
+import asyncio
+import logging
+from decimal import Decimal
+from exchange.ticker_hub import ticker_hub
+
+logger = logging.getLogger(__name__)
+
+def _floor_to(step: Decimal):
+    if not step:
+        return lambda value: value
+    return lambda value: (value // step) * step if value > 0 else Decimal(0)
+
+class SymbolFilter:
+    """
+    LOT_SIZE, PRICE_FILTER and MIN_NOTIONAL/NOTIONAL rules of one symbol,
+    kept as ready-made rounding functions.
+    """
+    __slots__ = ('base', 'quote', 'step', 'min_qty', 'tick', 'min_notional', 'quote_step',
+                 'round_qty', 'round_price', 'round_quote')
+
+    def __init__(self, symbol_info):
+        self.base = symbol_info.get('baseAsset')
+        self.quote = symbol_info.get('quoteAsset')
+        by_type = {f['filterType']: f for f in symbol_info.get('filters', [])}
+        lot = by_type.get('LOT_SIZE', {})
+        price = by_type.get('PRICE_FILTER', {})
+        notional = by_type.get('NOTIONAL') or by_type.get('MIN_NOTIONAL') or {}
+        self.step = Decimal(lot.get('stepSize', '0')).normalize()
+        self.min_qty = Decimal(lot.get('minQty', '0'))
+        self.tick = Decimal(price.get('tickSize', '0')).normalize()
+        self.min_notional = Decimal(notional.get('minNotional', '0'))
+        self.round_qty = _floor_to(self.step)
+        self.round_price = _floor_to(self.tick)
+        # quoteOrderQty is limited to the quote asset precision
+        self.quote_step = Decimal(1).scaleb(-int(symbol_info.get('quoteAssetPrecision', symbol_info.get('quotePrecision', 8))))
+        self.round_quote = _floor_to(self.quote_step)
+
+    def check(self, quantity: Decimal, price=None):
+        """Returns an error string if the order would be rejected, else None."""
+        if quantity <= 0 or quantity < self.min_qty:
+            return f"quantity {quantity} below minQty {self.min_qty}"
+        if price and self.min_notional and quantity * Decimal(str(price)) < self.min_notional:
+            return f"notional {quantity * Decimal(str(price))} below minNotional {self.min_notional}"
+        return None
+
+    def check_quote(self, quote_quantity: Decimal):
+        """Same as check() for an order sized in the quote asset."""
+        if quote_quantity <= 0:
+            return f"quote quantity {quote_quantity} is not positive"
+        if self.min_notional and quote_quantity < self.min_notional:
+            return f"notional {quote_quantity} below minNotional {self.min_notional}"
+        return None
+
+class SymbolFilterCache:
+    """
+    Per-process symbol filters built from the shared exchange info and
+    refreshed in the background, so sizing an order needs no REST call.
+    """
+    def __init__(self, refresh_sec: float = 3600.0):
+        self.refresh_sec = refresh_sec
+        self.filters = {}
+        self.info = None
+        self._task = None
+
+    async def load(self):
+        info = await ticker_hub.get_exchange_info()
+        if info is not self.info:
+            self.filters = {s['symbol']: SymbolFilter(s) for s in info.get('symbols', [])}
+            self.info = info
+        return self.filters
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_sec)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.warning(f"symbol filter refresh failed: {e}")
+
+    async def get(self, symbol: str):
+        if self.info is None:
+            await self.load()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+        return self.filters.get(symbol)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+symbol_filters = SymbolFilterCache()
@@ -0,0 +1,64 @@
+# ticker_hub.py
+import asyncio
+import logging
+import time
+from binance import AsyncClient
+
+logger = logging.getLogger(__name__)
+
+class TickerHub:
+    """
+    Public Binance market data fetched once per interval and shared by every
+    user loop. Per-user clients are only needed for private endpoints.
+    """
+    def __init__(self, ttl: float = 1.0, exchange_info_ttl: float = 3600.0):
+        self.ttl = ttl
+        self.exchange_info_ttl = exchange_info_ttl
+        self.client = None
+        self._cache = {}
+        self._locks = {}
+
+    async def _client(self):
+        if self.client is None:
+            self.client = await AsyncClient.create()
+        return self.client
+
+    async def _get(self, name, fetch, ttl):
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            hit = self._cache.get(name)
+            if hit and time.monotonic() - hit[0] < ttl:
+                return hit[1]
+            data = await fetch(await self._client())
+            self._cache[name] = (time.monotonic(), data)
+            return data
+
+    async def get_ticker(self):
+        """24h tickers for every symbol (includes bidPrice/askPrice/lastPrice)."""
+        return await self._get('ticker', lambda c: c.get_ticker(), self.ttl)
+
+    async def get_all_tickers(self):
+        """Last price for every symbol."""
+        return await self._get('all_tickers', lambda c: c.get_all_tickers(), self.ttl)
+
+    async def get_orderbook_tickers(self):
+        """Best bid/ask for every symbol (bookTicker)."""
+        return await self._get('orderbook_tickers', lambda c: c.get_orderbook_tickers(), self.ttl)
+
+    async def get_exchange_info(self):
+        """Exchange info for every symbol, refreshed on a slow schedule."""
+        return await self._get('exchange_info', lambda c: c.get_exchange_info(), self.exchange_info_ttl)
+
+    def age(self, name):
+        hit = self._cache.get(name)
+        return time.monotonic() - hit[0] if hit else None
+
+    async def close(self):
+        if self.client is not None:
+            try:
+                await self.client.close_connection()
+            except Exception:
+                pass
+            self.client = None
+
+ticker_hub = TickerHub()
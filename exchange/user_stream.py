@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import time
+import websockets
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+USER_STREAM_URL = "wss://stream.binance.com:9443/ws"
+TESTNET_USER_STREAM_URL = "wss://testnet.binance.vision/ws"
+KEEPALIVE_SEC = 30 * 60
+
+class BalanceCache:
+    # balances of one account: loaded over REST once, then kept current by the
+    # user-data stream; REST is only hit again after a reconnect or an expired key.
+    # load_fn() -> raw account ({'balances': [...], 'updateTime': ms}),
+    # listen_key_fn() -> listenKey, keepalive_fn(listenKey); all three are coroutines
+    def __init__(self, load_fn, listen_key_fn, keepalive_fn, url=None, keepalive_sec=KEEPALIVE_SEC):
+        self.load_fn = load_fn
+        self.listen_key_fn = listen_key_fn
+        self.keepalive_fn = keepalive_fn
+        self.url = url or (TESTNET_USER_STREAM_URL if settings.binance_testnet else USER_STREAM_URL)
+        self.keepalive_sec = keepalive_sec
+        self.free = {}
+        self.locked = {}
+        self.updated = {}  # asset -> exchange time (ms) of the last applied value
+        self.orders = {}  # orderId -> last executionReport
+        self.synced = False
+        self.synced_at = 0.0
+        self.events = 0
+        self.resyncs = 0
+        self.task = None
+
+    @classmethod
+    def for_async_client(cls, client, **kw):
+        # python-binance AsyncClient
+        async def listen_key():
+            return await client.stream_get_listen_key()
+        return cls(client.get_account, listen_key, client.stream_keepalive, **kw)
+
+    @classmethod
+    def for_ccxt(cls, client, **kw):
+        # exchange.binance_client.BinanceClient (synchronous ccxt)
+        return cls(
+            lambda: asyncio.to_thread(client.fetch_account),
+            lambda: asyncio.to_thread(client.create_listen_key),
+            lambda key: asyncio.to_thread(client.keepalive_listen_key, key),
+            **kw,
+        )
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.synced = False
+
+    async def run(self):
+        backoff = 1
+        while True:
+            keepalive = None
+            try:
+                key = await self.listen_key_fn()
+                async with websockets.connect(f"{self.url}/{key}", max_size=None) as ws:
+                    keepalive = asyncio.create_task(self._keepalive(key))
+                    # connect first, then load: events newer than the snapshot win per asset
+                    await self.resync()
+                    backoff = 1
+                    async for raw in ws:
+                        if not self.on_message(json.loads(raw)):
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"user stream reconnect in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                self.synced = False
+                if keepalive is not None:
+                    keepalive.cancel()
+
+    async def _keepalive(self, key):
+        while True:
+            await asyncio.sleep(self.keepalive_sec)
+            try:
+                await self.keepalive_fn(key)
+            except Exception as e:
+                logger.warning(f"listenKey keepalive failed: {e}")
+
+    async def resync(self):
+        account = await self.load_fn()
+        self.load_account(account)
+        self.resyncs += 1
+
+    def load_account(self, account):
+        ts = int(account.get('updateTime') or 0)
+        for b in account.get('balances', []):
+            self._set(b['asset'], b['free'], b['locked'], ts)
+        self.synced = True
+        self.synced_at = time.monotonic()
+
+    def _set(self, asset, free, locked, ts):
+        if ts < self.updated.get(asset, 0):
+            return
+        self.free[asset] = float(free)
+        self.locked[asset] = float(locked)
+        self.updated[asset] = ts
+
+    def on_message(self, msg):
+        # returns False when the stream has to be reopened with a new listenKey
+        self.events += 1
+        data = msg.get('data', msg)
+        kind = data.get('e')
+        if kind == 'outboundAccountPosition':
+            ts = int(data.get('u') or data.get('E') or 0)
+            for b in data.get('B', []):
+                self._set(b['a'], b['f'], b['l'], ts)
+        elif kind == 'balanceUpdate':
+            asset = data['a']
+            self.free[asset] = self.free.get(asset, 0.0) + float(data['d'])
+        elif kind == 'executionReport':
+            self.orders[data['i']] = data
+            if len(self.orders) > 1000:
+                self.orders.pop(next(iter(self.orders)))
+        elif kind == 'listenKeyExpired':
+            return False
+        return True
+
+    def balance(self, asset):
+        # free amount, or None while the cache is not synced (callers fall back to REST)
+        if not self.synced:
+            return None
+        return self.free.get(asset, 0.0)
+
+    def free_balances(self):
+        return dict(self.free) if self.synced else None
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Integer, String, Float, Boolean, DateTime, ForeignKey, JSON, Text
+from sqlalchemy import Integer, String, Float, Boolean, DateTime, ForeignKey, JSON, Text, Index
 from datetime import datetime
 from config import settings
 
@@ -10,13 +10,13 @@ class User(Base):
     __tablename__ = "users"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String(128), unique=True)
-    telegram_chat_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    telegram_chat_id: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 class ApiKey(Base):
     __tablename__ = "api_keys"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     exchange: Mapped[str] = mapped_column(String(32), default="binance")
     api_key: Mapped[str] = mapped_column(Text)
     api_secret: Mapped[str] = mapped_column(Text)
@@ -26,18 +26,22 @@ class ApiKey(Base):
 class AccountSetting(Base):
     __tablename__ = "account_settings"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     trading_amount_usdt: Mapped[float] = mapped_column(Float, default=10.0)
     is_running: Mapped[bool] = mapped_column(Boolean, default=False)
     bnb_reserve: Mapped[float] = mapped_column(Float, default=settings.bnb_min_reserve)
     accumulated_profit: Mapped[float] = mapped_column(Float, default=0.0)
     last_compound_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    inventory_mode: Mapped[bool] = mapped_column(Boolean, default=False)
+    inventory_targets: Mapped[dict | None] = mapped_column(JSON, nullable=True)
 
 class Opportunity(Base):
     __tablename__ = "opportunities"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    __table_args__ = (Index("ix_opportunities_user_id_created_at", "user_id", "created_at"),)
+    # created_at is part of the key so the table can be RANGE-partitioned by day (see core.retention)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)
     length: Mapped[int] = mapped_column(Integer)
     route: Mapped[str] = mapped_column(String(512))
     expected_gross_pct: Mapped[float] = mapped_column(Float)
@@ -45,8 +49,20 @@ class Opportunity(Base):
     reason: Mapped[str | None] = mapped_column(String(255))
     viable: Mapped[bool] = mapped_column(Boolean, default=False)
 
+class OpportunityRollup(Base):
+    __tablename__ = "opportunity_rollups"
+    minute: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    route: Mapped[str] = mapped_column(String(512), primary_key=True)
+    length: Mapped[int] = mapped_column(Integer)
+    samples: Mapped[int] = mapped_column(Integer, default=0)
+    viable: Mapped[int] = mapped_column(Integer, default=0)
+    sum_net_pct: Mapped[float] = mapped_column(Float, default=0.0)
+    min_net_pct: Mapped[float] = mapped_column(Float)
+    max_net_pct: Mapped[float] = mapped_column(Float)
+
 class Trade(Base):
     __tablename__ = "trades"
+    __table_args__ = (Index("ix_trades_user_id_started_at", "user_id", "started_at"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer)
     started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -61,6 +77,7 @@ class Trade(Base):
 
 class FeeLedger(Base):
     __tablename__ = "fee_ledger"
+    __table_args__ = (Index("ix_fee_ledger_user_id_ts", "user_id", "ts"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer)
     ts: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -7,12 +7,17 @@ import asyncio
 import logging
 from typing import List, Dict, Any, Tuple, Optional
 import math
+import numpy as np
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from flask import Flask
 from threading import Thread
 from binance import AsyncClient
 from binance.enums import ORDER_TYPE_MARKET, SIDE_BUY, SIDE_SELL
+from exchange.ticker_hub import ticker_hub
+from exchange.user_stream import BalanceCache
+from core.pricing import log_returns
+from config import settings
 
 # ----------------- إعدادات التسجيل (Logging) -----------------
 logging.basicConfig(
@@ -27,6 +32,7 @@ logger = logging.getLogger("TradingBot")
 USER_DATA = {}  # {telegram_id: {'api_key': '...', 'api_secret': '...', 'amount': '...'}}
 TRADING_RUNNING = {}  # A flag for each user to indicate if the trading loop is active
 USER_CLIENTS = {}  # A cache for Binance clients for each user
+USER_BALANCES = {}  # {telegram_id: BalanceCache} kept current by the user-data stream when USER_STREAM is on
 EXCHANGE_INFO_CACHE = {}  # A cache for exchange information
 
 def save_user_api_keys(telegram_id: int, api_key: str, api_secret: str):
@@ -72,10 +78,18 @@ async def get_client_for_user(telegram_id: int) -> AsyncClient:
     
     client = await AsyncClient.create(api_key, api_secret)
     USER_CLIENTS[telegram_id] = client
+    # same switch as the orchestrator path; without it balances are read over REST
+    if settings.user_stream:
+        balances = BalanceCache.for_async_client(client)
+        balances.start()
+        USER_BALANCES[telegram_id] = balances
     return client
 
 async def close_clients():
     """Closes all cached client connections."""
+    for b in USER_BALANCES.values():
+        b.stop()
+    USER_BALANCES.clear()
     for c in list(USER_CLIENTS.values()):
         try:
             await c.close_connection()
@@ -83,6 +97,15 @@ async def close_clients():
             pass
     USER_CLIENTS.clear()
 
+async def get_free_balance(client: AsyncClient, telegram_id: int, asset: str) -> float:
+    """Free balance from the user's stream-fed cache, or over REST when USER_STREAM is off or the cache is not synced."""
+    balances = USER_BALANCES.get(telegram_id)
+    cached = balances.balance(asset) if balances is not None else None
+    if cached is not None:
+        return cached
+    bal = await client.get_asset_balance(asset=asset)
+    return float(bal['free']) if bal else 0.0
+
 async def get_exchange_info(client: AsyncClient, symbol: str) -> Dict[str, Any]:
     """Fetches exchange information for a given symbol with caching."""
     if symbol in EXCHANGE_INFO_CACHE:
@@ -112,15 +135,10 @@ def floor_quantity_to_step_size(quantity: float, step_size: float) -> float:
         return 0.0
     return math.floor(quantity / step_size) * step_size
 
-async def check_user_balance(client: AsyncClient, trading_amount: float) -> bool:
+async def check_user_balance(client: AsyncClient, telegram_id: int, trading_amount: float) -> bool:
     """Checks if the user has sufficient USDT balance."""
     try:
-        info = await client.get_account()
-        usdt_balance = 0.0
-        for asset in info['balances']:
-            if asset['asset'] == 'USDT':
-                usdt_balance = float(asset['free'])
-                break
+        usdt_balance = await get_free_balance(client, telegram_id, 'USDT')
         return usdt_balance >= trading_amount
     except Exception as e:
         logger.error(f"Error checking balance: {e}")
@@ -133,7 +151,7 @@ async def start_arbitrage(telegram_id: int):
         client = await get_client_for_user(telegram_id)
         trading_amount_usdt = get_amount(telegram_id)
         
-        if not await check_user_balance(client, trading_amount_usdt):
+        if not await check_user_balance(client, telegram_id, trading_amount_usdt):
             logger.error(f"Cannot start arbitrage for {telegram_id}: Insufficient balance.")
             TRADING_RUNNING.pop(telegram_id, None)
             return
@@ -169,9 +187,13 @@ async def stop_arbitrage(telegram_id: int = None):
         for k in list(TRADING_RUNNING.keys()):
             TRADING_RUNNING[k] = False
         await close_clients()
+        await ticker_hub.close()
         logger.info("Stopped all arbitrage loops")
     else:
         TRADING_RUNNING[telegram_id] = False
+        balances = USER_BALANCES.pop(telegram_id, None)
+        if balances:
+            balances.stop()
         client = USER_CLIENTS.pop(telegram_id, None)
         if client:
             try:
@@ -203,117 +225,127 @@ async def get_price(client: AsyncClient, symbol: str) -> float:
     except Exception:
         return 0.0
 
-async def calculate_arbitrage_opportunities(client: AsyncClient) -> List[Dict[str, Any]]:
+class AssetIndex:
     """
-    Detects triangular, quadrilateral, and pentagonal arbitrage opportunities.
-    Returns a list of opportunities sorted by estimated profit.
+    Base/quote adjacency derived once from exchange info, plus every
+    USDT -> A -> ... -> USDT path of 3-5 legs, stored as symbol-index/buy-flag
+    matrices so each path and its reverse are scored in one pass. Middle legs
+    go either way: sell the held asset as base, or spend it as quote.
+    """
+    def __init__(self, exchange_info: Dict[str, Any], anchor: str = "USDT", max_legs: int = 5):
+        self.anchor = anchor
+        self.info = exchange_info
+        self.pairs = {}  # symbol -> (base, quote)
+        for s in exchange_info.get("symbols", []):
+            if s.get("status", "TRADING") == "TRADING":
+                self.pairs[s["symbol"]] = (s["baseAsset"], s["quoteAsset"])
+        self.signature = frozenset(self.pairs.items())
+        self.by_base = {}  # base -> [(symbol, quote)]
+        self.by_quote = {}  # quote -> [(symbol, base)]
+        self.to_anchor = {}  # asset -> symbol with that asset as base and the anchor as quote
+        for sym, (base, quote) in self.pairs.items():
+            self.by_base.setdefault(base, []).append((sym, quote))
+            self.by_quote.setdefault(quote, []).append((sym, base))
+            if quote == anchor:
+                self.to_anchor[base] = sym
+        self.symbols = sorted(self.pairs)
+        symbol_ids = {s: i for i, s in enumerate(self.symbols)}
+        self.paths = self._build_paths(max_legs)
+        self.legs = np.full((len(self.paths), max_legs), -1, dtype=np.int32)
+        self.buys = np.zeros((len(self.paths), max_legs), dtype=bool)
+        for i, path in enumerate(self.paths):
+            for j, (sym, side) in enumerate(path):
+                self.legs[i, j] = symbol_ids[sym]
+                self.buys[i, j] = side == SIDE_BUY
+        self.lengths = (self.legs >= 0).sum(axis=1)
+
+    def _build_paths(self, max_legs: int) -> List[Tuple[Tuple[str, str], ...]]:
+        # first leg buys A with the anchor, middle legs sell the held asset (base -> quote) or
+        # buy with it (quote -> base), last leg sells back to the anchor. A path's reverse is
+        # also such a path and score_paths scores both directions, so only the one whose first
+        # symbol sorts lower is kept.
+        paths = []
+        def walk(asset, path, seen):
+            if len(path) >= 2 and asset in self.to_anchor and path[0][0] < self.to_anchor[asset]:
+                paths.append(tuple(path + [(self.to_anchor[asset], SIDE_SELL)]))
+            if len(path) + 1 >= max_legs:
+                return
+            for sym, quote in self.by_base.get(asset, []):
+                if quote not in seen:
+                    walk(quote, path + [(sym, SIDE_SELL)], seen | {quote})
+            for sym, base in self.by_quote.get(asset, []):
+                if base not in seen:
+                    walk(base, path + [(sym, SIDE_BUY)], seen | {base})
+        for asset, sym in self.to_anchor.items():
+            walk(asset, [(sym, SIDE_BUY)], {self.anchor, asset})
+        return paths
+
+ASSET_INDEX: Optional[AssetIndex] = None
+OPPORTUNITY_TYPES = {3: ("tri", 0.0001), 4: ("quad", 0.00015), 5: ("penta", 0.0002)}
+
+async def get_asset_index() -> AssetIndex:
+    """Returns the adjacency index, rebuilding it only when exchange info changes."""
+    global ASSET_INDEX
+    info = await ticker_hub.get_exchange_info()
+    if ASSET_INDEX is None or ASSET_INDEX.info is not info:
+        # enumerating every 3-5 leg path takes seconds on a full exchange; keep it off the event loop
+        index = await asyncio.to_thread(AssetIndex, info)
+        if ASSET_INDEX is not None and index.signature == ASSET_INDEX.signature:
+            ASSET_INDEX.info = info
+        else:
+            ASSET_INDEX = index
+    return ASSET_INDEX
+
+def _reverse(path):
+    return tuple((sym, SIDE_SELL if side == SIDE_BUY else SIDE_BUY) for sym, side in reversed(path))
+
+def score_paths(index: AssetIndex, book: Dict[str, Tuple[float, float]], fee: float = 0.001) -> List[Dict[str, Any]]:
+    """
+    Returns up to 10 paths per direction whose profit ratio, after the taker
+    fee on every leg, clears the threshold for their length.
     """
-    tickers = await client.get_all_tickers()
-    symbols = [t["symbol"] for t in tickers]
-    price_map = {t["symbol"]: float(t["price"]) for t in tickers}
+    if not index.paths:
+        return []
+    bid = np.array([book.get(s, (0.0, 0.0))[0] for s in index.symbols], dtype=float)
+    ask = np.array([book.get(s, (0.0, 0.0))[1] for s in index.symbols], dtype=float)
+    forward, reverse, lengths = log_returns(index.legs, index.buys, bid, ask)
+    fees = lengths * math.log(1 - fee)
+    forward, reverse = np.expm1(forward + fees), np.expm1(reverse + fees)
+    thresholds = np.array([OPPORTUNITY_TYPES[n][1] for n in index.lengths])
 
     opportunities = []
-    TRADING_FEE = 0.001
-
-    def has(sym):
-        return sym in price_map
-
-    # --- Triangular Arbitrage: A/USDT -> A/B -> B/USDT ---
-    for s_a_usdt in [s for s in symbols if s.endswith("USDT")]:
-        coin_a = s_a_usdt[:-4]
-        for s_a_b in [s for s in symbols if s.startswith(coin_a) and s != s_a_usdt]:
-            coin_b = s_a_b[len(coin_a):]
-            final = f"{coin_b}USDT"
-            if not has(final):
-                continue
-            
-            pa = price_map[s_a_usdt]
-            pab = price_map[s_a_b]
-            pfinal = price_map[final]
-            try:
-                final_usdt = (1.0 * (1 - TRADING_FEE) / pa) * pab * (1 - TRADING_FEE) * pfinal * (1 - TRADING_FEE)
-                est_profit = final_usdt - 1.0
-                if est_profit > 0.0001:
-                    opp = {
-                        "type": "tri",
-                        "path": [s_a_usdt, s_a_b, final],
-                        "est_profit_ratio": est_profit,
-                    }
-                    opportunities.append(opp)
-            except Exception:
-                continue
-
-    # --- Quadrilateral Arbitrage: A/USDT -> A/B -> B/C -> C/USDT ---
-    for s_a_usdt in [s for s in symbols if s.endswith("USDT")]:
-        coin_a = s_a_usdt[:-4]
-        for s_a_b in [s for s in symbols if s.startswith(coin_a) and s != s_a_usdt]:
-            coin_b = s_a_b[len(coin_a):]
-            for s_b_c in [s for s in symbols if s.startswith(coin_b) and s not in (s_a_b, s_a_usdt)]:
-                coin_c = s_b_c[len(coin_b):]
-                final = f"{coin_c}USDT"
-                if not has(final):
-                    continue
-                try:
-                    pa = price_map[s_a_usdt]
-                    pab = price_map[s_a_b]
-                    pbc = price_map[s_b_c]
-                    pfinal = price_map[final]
-                    final_usdt = (1.0 * (1 - TRADING_FEE) / pa) * pab * (1 - TRADING_FEE) * pbc * (1 - TRADING_FEE) * pfinal * (1 - TRADING_FEE)
-                    est_profit = final_usdt - 1.0
-                    if est_profit > 0.00015:
-                        opp = {
-                            "type": "quad",
-                            "path": [s_a_usdt, s_a_b, s_b_c, final],
-                            "est_profit_ratio": est_profit,
-                        }
-                        opportunities.append(opp)
-                except Exception:
-                    continue
-                    
-    # --- Pentagonal Arbitrage (5 steps) ---
-    for s_a_usdt in [s for s in symbols if s.endswith("USDT")]:
-        coin_a = s_a_usdt[:-4]
-        for s_a_b in [s for s in symbols if s.startswith(coin_a) and s != s_a_usdt]:
-            coin_b = s_a_b[len(coin_a):]
-            for s_b_c in [s for s in symbols if s.startswith(coin_b) and s not in (s_b_c, s_a_b)]:
-                coin_c = s_b_c[len(coin_b):]
-                for s_c_d in [s for s in symbols if s.startswith(coin_c) and s not in (s_b_c, s_a_b, s_a_usdt)]:
-                    coin_d = s_c_d[len(coin_c):]
-                    final = f"{coin_d}USDT"
-                    if not has(final):
-                        continue
-                    try:
-                        pa = price_map[s_a_usdt]
-                        pab = price_map[s_a_b]
-                        pbc = price_map[s_b_c]
-                        pcd = price_map[s_c_d]
-                        pfinal = price_map[final]
-                        final_usdt = (1.0 * (1 - TRADING_FEE) / pa) * pab * (1 - TRADING_FEE) * pbc * (1 - TRADING_FEE) * pcd * (1 - TRADING_FEE) * pfinal * (1 - TRADING_FEE)
-                        est_profit = final_usdt - 1.0
-                        if est_profit > 0.0002:
-                            opp = {
-                                "type": "penta",
-                                "path": [s_a_usdt, s_a_b, s_b_c, s_c_d, final],
-                                "est_profit_ratio": est_profit,
-                            }
-                            opportunities.append(opp)
-                    except Exception:
-                        continue
-
-
+    for profits, flip in ((forward, False), (reverse, True)):
+        hits = np.flatnonzero(profits > thresholds)
+        if len(hits) > 10:
+            hits = hits[np.argpartition(profits[hits], -10)[-10:]]
+        for i in hits:
+            path = _reverse(index.paths[i]) if flip else index.paths[i]
+            opportunities.append({
+                "type": OPPORTUNITY_TYPES[len(path)][0],
+                "path": [sym for sym, _ in path],
+                "sides": [side for _, side in path],
+                "prices": [book[sym][1] if side == SIDE_BUY else book[sym][0] for sym, side in path],
+                "est_profit_ratio": float(profits[i]),
+            })
     opportunities.sort(key=lambda x: x["est_profit_ratio"], reverse=True)
     return opportunities[:10]
 
-async def sell_to_usdt(client: AsyncClient, asset: str) -> bool:
+async def calculate_arbitrage_opportunities(client: AsyncClient) -> List[Dict[str, Any]]:
+    """
+    Detects triangular, quadrilateral, and pentagonal arbitrage opportunities
+    in both directions from one bulk bookTicker snapshot.
+    Returns a list of opportunities sorted by estimated profit.
+    """
+    index = await get_asset_index()
+    tickers = await ticker_hub.get_orderbook_tickers()
+    book = {t["symbol"]: (float(t["bidPrice"]), float(t["askPrice"])) for t in tickers}
+    return score_paths(index, book)
+
+async def sell_to_usdt(client: AsyncClient, telegram_id: int, asset: str) -> bool:
     """Rollback function: sells the specified asset to USDT."""
     symbol = f"{asset}USDT"
     try:
-        balances = await client.get_account()
-        qty = 0.0
-        for bal in balances['balances']:
-            if bal['asset'] == asset:
-                qty = float(bal['free'])
-                break
+        qty = await get_free_balance(client, telegram_id, asset)
         if qty > 0:
             info = await get_exchange_info(client, symbol)
             if not info: return False
@@ -334,63 +366,45 @@ async def sell_to_usdt(client: AsyncClient, asset: str) -> bool:
 async def execute_arbitrage(client: AsyncClient, telegram_id: int, opportunity: dict, usd_amount: float):
     """
     Converts the opportunity path into actual market orders.
+    Each leg follows the side it was priced with: BUY spends the held quote
+    asset at the ask, SELL sells the held base asset at the bid.
     """
     path = opportunity.get("path", [])
+    sides = opportunity.get("sides", [])
+    quoted = opportunity.get("prices", [])
     current_asset_quantity = usd_amount
+    held = "USDT"
     
     try:
-        for i, symbol in enumerate(path):
+        for i, (symbol, side) in enumerate(zip(path, sides)):
             info = await get_exchange_info(client, symbol)
             if not info:
                 logger.error(f"Could not get exchange info for {symbol}")
                 return False
             min_notional = get_symbol_min_notional(info)
+            step_size = get_symbol_step_size(info)
+            price = quoted[i] if i < len(quoted) and quoted[i] else await get_price(client, symbol)
+            if price <= 0:
+                return False
 
-            if symbol.endswith("USDT"):
-                price = await get_price(client, symbol)
-                if price <= 0: return False
-                raw_qty = current_asset_quantity / price
-                step_size = get_symbol_step_size(info)
-                qty = floor_quantity_to_step_size(raw_qty, step_size)
-                if qty * price < min_notional:
-                    logger.warning(f"Order quantity {qty} for {symbol} is below min notional {min_notional}.")
-                    return False
-                res = await place_market_order(client, symbol, SIDE_BUY, qty)
-                if not res: return False
+            raw_qty = current_asset_quantity / price if side == SIDE_BUY else current_asset_quantity
+            qty = floor_quantity_to_step_size(raw_qty, step_size)
+            if qty * price < min_notional:
+                logger.warning(f"Order quantity {qty} for {symbol} is below min notional {min_notional}.")
+                if held != "USDT":
+                    await sell_to_usdt(client, telegram_id, held)
+                return False
+            res = await place_market_order(client, symbol, side, qty)
+            if not res:
+                if held != "USDT":
+                    await sell_to_usdt(client, telegram_id, held)
+                return False
+            if side == SIDE_BUY:
                 current_asset_quantity = float(res['executedQty'])
+                held = info['baseAsset']
             else:
-                base_asset = info['baseAsset']
-                quote_asset = info['quoteAsset']
-                if path[i-1].endswith(base_asset):
-                    side = SIDE_SELL
-                    price = await get_price(client, symbol)
-                    if price <= 0: return False
-                    raw_qty = current_asset_quantity
-                    step_size = get_symbol_step_size(info)
-                    qty = floor_quantity_to_step_size(raw_qty, step_size)
-                    if qty * price < min_notional:
-                        logger.warning(f"Order quantity {qty} for {symbol} is below min notional {min_notional}.")
-                        return False
-                    res = await place_market_order(client, symbol, side, qty)
-                    if not res:
-                        await sell_to_usdt(client, base_asset)
-                        return False
-                    current_asset_quantity = float(res['executedQty'])
-                else:
-                    side = SIDE_BUY
-                    price = await get_price(client, symbol)
-                    if price <= 0: return False
-                    raw_qty = current_asset_quantity / price
-                    step_size = get_symbol_step_size(info)
-                    qty = floor_quantity_to_step_size(raw_qty, step_size)
-                    if qty * price < min_notional:
-                        logger.warning(f"Order quantity {qty} for {symbol} is below min notional {min_notional}.")
-                        return False
-                    res = await place_market_order(client, symbol, side, qty)
-                    if not res:
-                        await sell_to_usdt(client, quote_asset)
-                        return False
-                    current_asset_quantity = float(res['executedQty'])
+                current_asset_quantity = float(res['cummulativeQuoteQty'])
+                held = info['quoteAsset']
 
         final_usdt_quantity = current_asset_quantity
         profit = final_usdt_quantity - usd_amount
@@ -400,9 +414,8 @@ async def execute_arbitrage(client: AsyncClient, telegram_id: int, opportunity:
     
     except Exception as e:
         logger.exception("execute_arbitrage error: %s", e)
-        path_assets = [p.replace('USDT', '') for p in path]
-        current_asset = path_assets[i]
-        await sell_to_usdt(client, current_asset)
+        if held != "USDT":
+            await sell_to_usdt(client, telegram_id, held)
         return False
 
 # ----------------- أوامر البوت (Bot Commands) -----------------
@@ -1,11 +1,16 @@
 # trading.py
 import asyncio
 import logging
+import math
+import time
+import numpy as np
 from binance.client import AsyncClient
 from binance.exceptions import BinanceAPIException
 from db import save_last_trades, get_user_api_keys, get_amount
+from exchange.ticker_hub import ticker_hub
+from exchange.symbol_filters import symbol_filters
+from core.pricing import log_returns
 from decimal import Decimal, getcontext
-from datetime import datetime
 
 # Set precision for Decimal calculations to avoid floating-point errors
 getcontext().prec = 28
@@ -13,109 +18,211 @@ getcontext().prec = 28
 logger = logging.getLogger(__name__)
 
 ARBITRAGE_LOOP_ACTIVE = {}
+REPORT_TASKS = set()  # strong references, so pending reports are not garbage-collected
 MIN_PROFIT_PERCENT = Decimal('0.001') # Minimum profit threshold (e.g., 0.1%)
-
-# Helper function to get the number of decimal places for a quantity
-async def _get_quantity_precision(client, symbol):
-    """
-    Fetches the number of decimal places allowed for a symbol's quantity.
-    """
-    try:
-        info = await client.get_symbol_info(symbol)
-        if info:
-            for f in info['filters']:
-                if f['filterType'] == 'LOT_SIZE':
-                    step_size = f['stepSize']
-                    # Calculate precision from step_size
-                    precision = int(abs(Decimal(step_size).log10()))
-                    return precision
-    except Exception as e:
-        logger.error(f"Failed to get precision for {symbol}: {e}")
-    return 8  # Default to 8 if not found
+TAKER_FEE = 0.001
+TOP_CANDIDATES = 5
 
 async def get_client_for_user(user_id):
-    api_keys = get_user_api_keys(user_id)
-    if not api_keys or 'api_key' not in api_keys or 'api_secret' not in api_keys:
+    api_keys = await get_user_api_keys(user_id)
+    if not api_keys or not api_keys.get('api_key') or not api_keys.get('api_secret'):
         raise ValueError("API keys not registered for this user.")
     return AsyncClient(api_keys['api_key'], api_keys['api_secret'])
 
-async def place_market_order(client, symbol, quantity, side):
+async def place_market_order(client, symbol, quantity, side, price=None, quote_quantity=None):
     """
-    Places a market order after rounding the quantity to the correct precision.
+    Places a market order and returns Binance's FULL response (with fills).
+    The quantity is floored to the symbol's LOT_SIZE step from the cached
+    exchange filters; pass quote_quantity instead to spend an exact amount of
+    the quote asset (quoteOrderQty). MIN_NOTIONAL/NOTIONAL is checked locally
+    before anything is sent.
     """
-    precision = await _get_quantity_precision(client, symbol)
-    # Round the quantity to the correct number of decimal places
-    rounded_quantity = round(Decimal(quantity), precision)
-    
-    if rounded_quantity <= 0:
-        logger.error(f"Order quantity is zero or negative for {symbol} {side}")
+    rules = await symbol_filters.get(symbol)
+    if quote_quantity is not None:
+        rounded = rules.round_quote(Decimal(quote_quantity)) if rules else Decimal(quote_quantity)
+        problem = rules.check_quote(rounded) if rules else (None if rounded > 0 else "zero quantity")
+        size = {'quoteOrderQty': f"{rounded:f}"}
+    else:
+        rounded = rules.round_qty(Decimal(quantity)) if rules else Decimal(quantity)
+        problem = rules.check(rounded, price) if rules else (None if rounded > 0 else "zero quantity")
+        size = {'quantity': f"{rounded:f}"}
+    if problem:
+        logger.error(f"Order rejected locally for {symbol} {side}: {problem}")
         return None
 
-    logger.info(f"Placing market order for {symbol} with quantity: {rounded_quantity}")
+    logger.info(f"Placing market order for {symbol} with {size}")
     try:
         order = await client.create_order(
             symbol=symbol,
             side=side,
             type='MARKET',
-            quantity=f"{rounded_quantity}"
+            newOrderRespType='FULL',
+            **size
         )
         logger.info(f"Order placed successfully: {order}")
         return order
     except BinanceAPIException as e:
         logger.error(f"BinanceAPIException: {e}")
     except Exception as e:
-        logger.error(f"place_market_order error {symbol} {side} {quantity}: {e}")
+        logger.error(f"place_market_order error {symbol} {side} {size}: {e}")
     return None
 
+def _received(order, side, rules):
+    """Net amount of the asset an order delivered, from its FULL response fills."""
+    if side == 'BUY':
+        got, asset = Decimal(order['executedQty']), rules.base if rules else None
+    else:
+        got, asset = Decimal(order['cummulativeQuoteQty']), rules.quote if rules else None
+    # commission is taken from the received asset unless it is paid in BNB
+    fee = sum((Decimal(f['commission']) for f in order.get('fills', []) if f.get('commissionAsset') == asset), Decimal(0))
+    return got - fee
+
+class TriangleIndex:
+    """
+    Every USDT -> A -> B -> USDT triangle derived once from exchange info,
+    stored as symbol-index/buy-flag matrices. Each triangle is kept in one
+    orientation; its reverse is scored from the same row.
+    """
+    def __init__(self, exchange_info, anchor='USDT'):
+        self.info = exchange_info
+        self.anchor = anchor
+        pairs = {}
+        for s in exchange_info.get('symbols', []):
+            if s.get('status', 'TRADING') == 'TRADING':
+                pairs[s['symbol']] = (s['baseAsset'], s['quoteAsset'])
+        self.signature = frozenset(pairs.items())
+        edges = {}  # asset -> [(symbol, side, asset received)]
+        for sym, (base, quote) in pairs.items():
+            edges.setdefault(quote, []).append((sym, 'BUY', base))
+            edges.setdefault(base, []).append((sym, 'SELL', quote))
+        back = {}  # asset -> [(symbol, side)] that turn it into the anchor
+        for sym, side, asset in edges.get(anchor, []):
+            back.setdefault(asset, []).append((sym, 'SELL' if side == 'BUY' else 'BUY'))
+        self.triangles = []
+        for s1, side1, a in edges.get(anchor, []):
+            for s2, side2, b in edges.get(a, []):
+                if b == anchor or s2 == s1:
+                    continue
+                for s3, side3 in back.get(b, []):
+                    # the same cycle is found again from s3 in reverse
+                    if s1 < s3:
+                        self.triangles.append(((s1, side1), (s2, side2), (s3, side3)))
+        self.symbols = sorted({sym for t in self.triangles for sym, _ in t})
+        self.symbol_ids = {s: i for i, s in enumerate(self.symbols)}
+        self.legs = np.array([[self.symbol_ids[sym] for sym, _ in t] for t in self.triangles], dtype=np.int32).reshape(-1, 3)
+        self.buys = np.array([[side == 'BUY' for _, side in t] for t in self.triangles], dtype=bool).reshape(-1, 3)
+
+TRIANGLE_INDEX = None
+
+async def get_triangle_index():
+    """Returns the triangle index, rebuilding it only when exchange info changes."""
+    global TRIANGLE_INDEX
+    info = await ticker_hub.get_exchange_info()
+    if TRIANGLE_INDEX is None or TRIANGLE_INDEX.info is not info:
+        index = TriangleIndex(info)
+        if TRIANGLE_INDEX is not None and index.signature == TRIANGLE_INDEX.signature:
+            TRIANGLE_INDEX.info = info
+        else:
+            TRIANGLE_INDEX = index
+    return TRIANGLE_INDEX
+
+def rank_triangles(index, tickers, top_n=TOP_CANDIDATES, fee=TAKER_FEE):
+    """
+    Returns the best triangles (either direction) above MIN_PROFIT_PERCENT,
+    most profitable first, with the taker fee compounded on all three legs.
+    """
+    if not index.triangles:
+        return []
+    quotes = {t['symbol']: t for t in tickers}
+    bid = np.array([float(quotes[s]['bidPrice']) if s in quotes else 0.0 for s in index.symbols])
+    ask = np.array([float(quotes[s]['askPrice']) if s in quotes else 0.0 for s in index.symbols])
+    forward, reverse, _ = log_returns(index.legs, index.buys, bid, ask)
+    scores = np.concatenate([forward, reverse]) + 3 * math.log(1 - fee)
+    profit = np.expm1(scores) * 100
+    profit = np.where(np.isnan(profit), -np.inf, profit)
+    n = len(index.triangles)
+    k = min(top_n, len(profit))
+    top = np.argpartition(-profit, k - 1)[:k]
+    top = top[np.argsort(-profit[top])]
+    candidates = []
+    for i in top.tolist():
+        percent = Decimal(str(profit[i]))
+        if not percent > MIN_PROFIT_PERCENT:
+            break
+        legs = index.triangles[i % n]
+        if i >= n:
+            legs = tuple((sym, 'SELL' if side == 'BUY' else 'BUY') for sym, side in reversed(legs))
+        prices = tuple(float(ask[index.symbol_ids[sym]] if side == 'BUY' else bid[index.symbol_ids[sym]]) for sym, side in legs)
+        candidates.append({
+            "symbols": tuple(sym for sym, _ in legs),
+            "sides": tuple(side for _, side in legs),
+            "prices": prices,
+            "profit_percent": percent,
+            "direction": "reverse" if i >= n else "forward",
+        })
+    return candidates
+
 async def find_arbitrage_opportunity(client):
     """
-    Finds a triangular arbitrage opportunity.
-    This logic has been revised to be more robust.
+    Ranks every triangle through USDT in both directions against the current
+    ticker snapshot and returns the top candidates (empty list if none pass).
     """
     logger.info("Fetching market data...")
-    tickers = await client.get_ticker()
-    
-    ticker_dict = {t['symbol']: Decimal(t['price']) for t in tickers}
-    
-    # Example pairs for a common triangle (e.g., BTC, ETH, USDT)
-    triangles = [
-        ("BTCUSDT", "ETHBTC", "ETHUSDT"),
-        ("ETHUSDT", "BTCETH", "BTCUSDT"),
-    ]
-    
-    for triangle in triangles:
-        symbol1, symbol2, symbol3 = triangle
-        
-        if not all(s in ticker_dict for s in triangle):
-            continue
-
-        try:
-            # First leg
-            rate1 = ticker_dict[symbol1]
-            # Second leg
-            rate2 = ticker_dict[symbol2]
-            # Third leg
-            rate3 = ticker_dict[symbol3]
-
-            # Calculation for one direction (e.g., USDT -> BTC -> ETH -> USDT)
-            profit_calculation_1 = (Decimal(1) / rate1) * rate2 * rate3
-            profit_percent_1 = (profit_calculation_1 - 1) * 100
-
-            if profit_percent_1 > MIN_PROFIT_PERCENT:
-                return (triangle, profit_percent_1, "forward")
-            
-            # Calculation for reverse direction (e.g., USDT -> ETH -> BTC -> USDT)
-            profit_calculation_2 = (Decimal(1) / rate3) * (Decimal(1) / rate2) * rate1
-            profit_percent_2 = (profit_calculation_2 - 1) * 100
+    index = await get_triangle_index()
+    tickers = await ticker_hub.get_ticker()
+    return rank_triangles(index, tickers)
 
-            if profit_percent_2 > MIN_PROFIT_PERCENT:
-                return (triangle, profit_percent_2, "reverse")
+async def execute_triangle(client, candidate, amount):
+    """
+    Chains the legs back to back: each leg is sized from the previous leg's
+    FULL fills (BUY legs spend it via quoteOrderQty, SELL legs sell it as the
+    base quantity). Nothing else is awaited between legs.
+    Returns the final USDT amount and one timing record per leg.
+    """
+    held = Decimal(str(amount))
+    legs = []
+    for n, (symbol, side, price) in enumerate(zip(candidate['symbols'], candidate['sides'], candidate['prices']), 1):
+        rules = await symbol_filters.get(symbol)
+        submitted = time.time()
+        if side == 'BUY':
+            order = await place_market_order(client, symbol, None, side, price, quote_quantity=held)
+        else:
+            order = await place_market_order(client, symbol, held, side, price)
+        acked = time.time()
+        if not order: raise Exception(f"Failed order {n} ({symbol} {side})")
+        held = _received(order, side, rules)
+        legs.append({
+            "symbol": symbol,
+            "side": side,
+            "order_id": order.get('orderId'),
+            "submitted_at": submitted,
+            "acked_at": acked,
+            "transact_time": order.get('transactTime'),
+            "received": held,
+        })
+    return held, legs
 
-        except Exception as e:
-            logger.error(f"Error calculating triangle {triangle}: {e}")
-            continue
+def _latency_report(legs):
+    lines = []
+    for n, leg in enumerate(legs):
+        ack_ms = (leg['acked_at'] - leg['submitted_at']) * 1000
+        gap_ms = (leg['submitted_at'] - legs[n - 1]['acked_at']) * 1000 if n else 0.0
+        lines.append(f"{n + 1}. {leg['side']} {leg['symbol']} → {leg['received']:f} (ack {ack_ms:.0f}ms, gap {gap_ms:.0f}ms)")
+    return "\n".join(lines)
 
-    return None
+async def _report_cycle(user_id, context, candidate, amount, final_amount, legs):
+    # runs after the cycle so Telegram and the DB never sit between two legs
+    route = "-".join(candidate['symbols'])
+    profit = final_amount - Decimal(str(amount))
+    logger.info(f"cycle {route} ({candidate['direction']}) legs: {legs}")
+    try:
+        await save_last_trades(user_id, route, profit)
+        await context.bot.send_message(chat_id=user_id, text=(
+            f"✅ تمت عملية التداول بالكامل: {route} ({candidate['direction']})\n"
+            f"ربح متوقع: {candidate['profit_percent']:.4f}% | ربح فعلي: {profit:.6f}$\n"
+            f"{_latency_report(legs)}"))
+    except Exception as e:
+        logger.error(f"cycle report failed for {user_id}: {e}")
 
 async def start_arbitrage(user_id, context):
     if ARBITRAGE_LOOP_ACTIVE.get(user_id):
@@ -123,7 +230,7 @@ async def start_arbitrage(user_id, context):
         return
 
     ARBITRAGE_LOOP_ACTIVE[user_id] = True
-    amount = get_amount(user_id)
+    amount = await get_amount(user_id)
 
     try:
         client = await get_client_for_user(user_id)
@@ -135,44 +242,14 @@ async def start_arbitrage(user_id, context):
 
     while ARBITRAGE_LOOP_ACTIVE.get(user_id):
         try:
-            opportunity = await find_arbitrage_opportunity(client)
+            candidates = await find_arbitrage_opportunity(client)
             
-            if opportunity:
-                triangle, profit_percent, direction = opportunity
-                await context.bot.send_message(chat_id=user_id, text=f"🎉 تم العثور على فرصة! ربح محتمل: {profit_percent:.4f}% في مثلث {triangle}")
-                
-                # Execute the trade sequence
-                if direction == "forward":
-                    symbol1, symbol2, symbol3 = triangle
-                    
-                    # Step 1: Buy First Asset (e.g., BTC) with USDT
-                    await context.bot.send_message(chat_id=user_id, text=f"1️⃣ شراء {symbol1}...")
-                    order1 = await place_market_order(client, symbol1, amount, 'BUY')
-                    if not order1: raise Exception("Failed order 1")
-                    await asyncio.sleep(1) # Wait for order to fill
-                    
-                    # Step 2: Buy Second Asset (e.g., ETH) with the First Asset (BTC)
-                    await context.bot.send_message(chat_id=user_id, text=f"2️⃣ شراء {symbol2}...")
-                    # Calculate quantity for the next trade
-                    quantity2 = Decimal(order1['executedQty']) / Decimal(order1['cummulativeQuoteQty']) * Decimal(order1['price'])
-                    order2 = await place_market_order(client, symbol2, quantity2, 'BUY')
-                    if not order2: raise Exception("Failed order 2")
-                    await asyncio.sleep(1) # Wait for order to fill
-                    
-                    # Step 3: Sell the Second Asset (ETH) for USDT to complete the cycle
-                    await context.bot.send_message(chat_id=user_id, text=f"3️⃣ بيع {symbol3}...")
-                    quantity3 = Decimal(order2['executedQty'])
-                    order3 = await place_market_order(client, symbol3, quantity3, 'SELL')
-                    if not order3: raise Exception("Failed order 3")
-                    await context.bot.send_message(chat_id=user_id, text="✅ تمت عملية التداول بالكامل.")
-                    
-                    # Calculate final profit
-                    final_amount = Decimal(order3['cummulativeQuoteQty'])
-                    profit = final_amount - Decimal(amount)
-                    save_last_trades(user_id, f"{triangle[0]}-{triangle[1]}-{triangle[2]}", profit, datetime.utcnow())
-                    await context.bot.send_message(chat_id=user_id, text=f"💰 نجاح! تم تسجيل ربح: {profit:.6f}$")
-
-                # The same logic needs to be implemented for the "reverse" direction
+            if candidates:
+                best = candidates[0]
+                final_amount, legs = await execute_triangle(client, best, amount)
+                task = asyncio.create_task(_report_cycle(user_id, context, best, amount, final_amount, legs))
+                REPORT_TASKS.add(task)
+                task.add_done_callback(REPORT_TASKS.discard)
                 
             else:
                 await context.bot.send_message(chat_id=user_id, text="🔍 لا توجد فرص تداول حالية. سأبحث مجدداً بعد دقيقة.")
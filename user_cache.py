@@ -0,0 +1,78 @@
+# user_cache.py
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL_SEC = float(os.getenv("USER_CACHE_TTL_SEC", 300))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+
+class TTLCache:
+    """
+    In-process read-through cache for per-user settings and credentials.
+    Entries expire after `ttl` seconds and the least recently used entry is
+    evicted past `maxsize`. Writers call invalidate() after committing; a load
+    that was in flight across an invalidation is not stored, so a stale read
+    cannot overwrite a newer write.
+    """
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SEC, report_sec=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.report_sec = report_sec
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.reported_at = time.monotonic()
+
+    async def get_or_load(self, key, load):
+        """Returns the cached value for key, or awaits load() and caches its result."""
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        if now - self.reported_at >= self.report_sec:
+            self.reported_at = now
+            logger.info(f"user cache: {self.stats()}")
+        generation = self.generation
+        value = await load()
+        if generation == self.generation:
+            self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys):
+        self.generation += 1
+        for key in keys:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+user_cache = TTLCache()